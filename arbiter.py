@@ -0,0 +1,367 @@
+'''Runs bao games between two BaoAgents, with no GUI involved.
+
+An Arbiter owns the game's bao.History, passes moves, messages, forfeits
+and undo requests between the players and reports what happens to its
+subscribers (see Arbiter.subscribe for the events). Requests are queued
+and handled one at a time, either by the arbiter's own thread (start) or
+by whoever calls process.
+
+AsyncArbiter does the same for baoAgent.AsyncBaoAgents on an asyncio event
+loop, one loop can run many games at once. AgentAdapter lets threaded
+BaoAgents play there too.
+'''
+import asyncio
+import queue
+import threading
+
+import bao
+import baoAgent
+
+
+class _BaseArbiter(object):
+    # Events and their listeners' arguments
+    EVENTS = {
+        'move_started': ('field', 'move'),
+        'sow': ('hole', 'value'),
+        'move_done': ('field', 'move'),
+        'move_rejected': ('field', 'move', 'reason'),
+        'ack': ('field', 'request', 'status', 'reason'),
+        'message': ('field', 'message'),
+        'undo': ('node',),
+        'game_over': ('winner', 'reason'),
+    }
+
+    def __init__(self, **kwargs):
+        '''Takes the arguments of bao.new_game.'''
+        self.game = bao.new_game(**kwargs)
+        self.players = {}
+        self.winner = None
+        self.game_over = False
+        self.pending_undo = 0
+        self._listeners = dict((event, []) for event in self.EVENTS)
+
+    def subscribe(self, event, listener):
+        '''Call listener with the arguments listed in EVENTS on event.
+
+        'sow' is reported for every hole a move sows or captures from, in
+        the arbiter's thread and before the move is done, a listener may
+        slow the game down by taking its time (eg to animate moves).
+        '''
+        if event not in self._listeners:
+            raise ValueError('Unknown event: ' + event)
+        self._listeners[event].append(listener)
+
+    def unsubscribe(self, event, listener):
+        self._listeners[event].remove(listener)
+
+    def get_player(self, field):
+        return self.players[field]
+
+# private:
+    def _emit(self, event, *args):
+        for listener in list(self._listeners[event]):
+            listener(*args)
+
+    def _check_move(self, mv, field):
+        # Returns the move to make for mv, or None and why mv is rejected
+        if self.game_over:
+            return None, 'Game over'
+        elif self.game.get_player() != field:
+            return None, 'Not your turn yet'
+        move = self.game.get_closest_move(mv)
+        if move is None:
+            return None, 'Invalid move'
+        return move, None
+
+    def _make_move(self, field, move):
+        # Plays move once the opponent has been told about it
+        try:
+            if self._listeners['sow']:
+                self.game.branch(move, True, move_watcher=self._watch_sow)
+            else:
+                self.game.branch(move)
+        except bao.InvalidMoveError:
+            self._emit('move_rejected', field, move, 'Invalid move')
+            return None
+        except bao.LongMoveError:
+            self._emit('move_rejected', field, move, 'Long move')
+            return None
+        self._emit('move_done', field, move)
+
+        if self.game.is_game_over():
+            self._end_game(bao.Board.rival_field(self.game.get_player()),
+                           'no moves left')
+
+    def _watch_sow(self, hole, value):
+        self._emit('sow', hole, value)
+        return True
+
+    def _forfeit(self, field):
+        if not self.game_over:
+            self._end_game(bao.Board.rival_field(field), 'forfeit')
+
+    def _end_game(self, winner, reason):
+        self.game_over = True
+        self.winner = winner
+        self._emit('game_over', winner, reason)
+
+    def _message(self, msg, field):
+        # Only reported, passing messages on to the opponent is up to
+        # subscribers (engines answer each other's messages endlessly)
+        self._emit('message', field, msg)
+
+    def _ack(self, request, status, reason, field):
+        if request == baoAgent.RQ_UNDO and self.pending_undo != 0:
+            self.pending_undo -= 1
+            if status == baoAgent.STS_ACCEPT:
+                self._emit('undo', self.game.pop_node())
+        self._emit('ack', field, request, status, reason)
+
+
+class Arbiter(_BaseArbiter):
+    class Proxy(baoAgent.BaoAgent):
+        '''The arbiter as seen by the player on field.'''
+        def __init__(self, arbiter, field):
+            super(type(self), self).__init__()
+            self.arbiter = arbiter
+            self.field = field
+
+        def message(self, msg, from_=None):
+            self.arbiter.message(msg, self.field)
+
+        def move(self, mv):
+            self.arbiter.move(mv, self.field)
+
+        def forfeit(self):
+            self.arbiter.forfeit(self.field)
+
+        def ack(self, request, status, reason=None):
+            self.arbiter.ack(request, status, reason, self.field)
+
+    def __init__(self, **kwargs):
+        '''Takes the arguments of bao.new_game.'''
+        super(Arbiter, self).__init__(**kwargs)
+        self._requests = queue.Queue()
+        self._thread = None
+
+    def new_game(self, AB_player, ab_player):
+        '''Set the players up and ask them to start.'''
+        self.players = {'AB': AB_player, 'ab': ab_player}
+        for field, agent in self.players.items():
+            agent.set_arbiter(self.Proxy(self, field))
+        ab_player.message('go')
+        AB_player.message('go')
+
+    def start(self):
+        '''Handle requests in a thread of the arbiter's own.'''
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self, wait=True):
+        '''Stop the thread started by start once it has handled the
+        requests made so far.'''
+        if self._thread is not None:
+            self._requests.put(None)
+            if wait:
+                self._thread.join()
+            self._thread = None
+
+    def process(self, timeout=None):
+        '''Handle the next request in the calling thread.
+
+        Waits up to timeout seconds for one (forever if None), returns
+        False if none came.
+        '''
+        try:
+            request = self._requests.get(timeout=timeout)
+        except queue.Empty:
+            return False
+        if request is not None:
+            request[0](*request[1:])
+        return True
+
+# Requests, these may come from any thread:
+    def move(self, mv, field):
+        self._requests.put((self._move, mv, field))
+
+    def forfeit(self, field):
+        self._requests.put((self._forfeit, field))
+
+    def message(self, msg, field):
+        self._requests.put((self._message, msg, field))
+
+    def ack(self, request, status, reason, field):
+        self._requests.put((self._ack, request, status, reason, field))
+
+    def request_undo(self):
+        self._requests.put((self._request_undo,))
+
+# private:
+    def _run(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                break
+            request[0](*request[1:])
+
+    def _move(self, mv, field):
+        move, reason = self._check_move(mv, field)
+        if move is None:
+            self.players[field].ack(baoAgent.RQ_MOVE, baoAgent.STS_REJECT,
+                                    reason)
+            self._emit('move_rejected', field, mv, reason)
+            return None
+
+        self._emit('move_started', field, move)
+        self.players[bao.Board.rival_field(field)].move(move)
+        self._make_move(field, move)
+
+    def _request_undo(self):
+        for agent in self.players.values():
+            agent.undo()
+            self.pending_undo += 1
+
+
+class AsyncArbiter(_BaseArbiter):
+    '''Arbiter for baoAgent.AsyncBaoAgents.
+
+    Requests are coroutines run in the event loop's thread, there is no
+    thread of the arbiter's own. Listeners are called in that thread too,
+    they must not hold the loop up.
+    '''
+    class Proxy(baoAgent.AsyncBaoAgent):
+        '''The arbiter as seen by the player on field.'''
+        def __init__(self, arbiter, field):
+            self.arbiter = arbiter
+            self.field = field
+
+        async def message(self, msg, from_=None):
+            await self.arbiter.message(msg, self.field)
+
+        async def move(self, mv):
+            await self.arbiter.move(mv, self.field)
+
+        async def forfeit(self):
+            await self.arbiter.forfeit(self.field)
+
+        async def ack(self, request, status, reason=None):
+            await self.arbiter.ack(request, status, reason, self.field)
+
+    def __init__(self, **kwargs):
+        '''Takes the arguments of bao.new_game.'''
+        super(AsyncArbiter, self).__init__(**kwargs)
+        # Created in new_game, with the event loop running
+        self._lock = None
+        self._finished = None
+
+    async def new_game(self, AB_player, ab_player):
+        '''Set the players up and ask them to start.'''
+        self._lock = asyncio.Lock()
+        self._finished = asyncio.Event()
+        self.players = {'AB': AB_player, 'ab': ab_player}
+        for field, agent in self.players.items():
+            agent.set_arbiter(self.Proxy(self, field))
+        await ab_player.message('go')
+        await AB_player.message('go')
+
+    async def play(self, AB_player, ab_player):
+        '''Play a game between the players, returns the winner.'''
+        await self.new_game(AB_player, ab_player)
+        await self.wait()
+        return self.winner
+
+    async def wait(self):
+        '''Wait for the game started by new_game to end.'''
+        await self._finished.wait()
+
+    async def move(self, mv, field):
+        async with self._lock:
+            move, reason = self._check_move(mv, field)
+            if move is None:
+                await self.players[field].ack(baoAgent.RQ_MOVE,
+                                              baoAgent.STS_REJECT, reason)
+                self._emit('move_rejected', field, mv, reason)
+                return None
+
+            self._emit('move_started', field, move)
+            await self.players[bao.Board.rival_field(field)].move(move)
+            self._make_move(field, move)
+
+    async def forfeit(self, field):
+        async with self._lock:
+            self._forfeit(field)
+
+    async def message(self, msg, field):
+        self._message(msg, field)
+
+    async def ack(self, request, status, reason, field):
+        # Not locked, players acknowledge the requests made under the lock
+        self._ack(request, status, reason, field)
+
+    async def request_undo(self):
+        # Not locked either, a player may wait for its move to be made
+        # before undoing it
+        for agent in list(self.players.values()):
+            self.pending_undo += 1
+            await agent.undo()
+
+# private:
+    def _end_game(self, winner, reason):
+        super(AsyncArbiter, self)._end_game(winner, reason)
+        self._finished.set()
+
+
+class AgentAdapter(baoAgent.AsyncBaoAgent):
+    '''Lets a BaoAgent play under an AsyncArbiter.
+
+    The agent is called in the event loop's thread and must answer
+    quickly (Malume and MonteCarlo search in threads of their own), its
+    requests to the arbiter may come from any thread.
+    '''
+    class Proxy(baoAgent.BaoAgent):
+        '''The AsyncArbiter as seen by the agent.'''
+        def __init__(self, arbiter, loop):
+            super(type(self), self).__init__()
+            self.arbiter = arbiter
+            self.loop = loop
+
+        def message(self, msg, from_=None):
+            self._call(self.arbiter.message(msg))
+
+        def move(self, mv):
+            self._call(self.arbiter.move(mv))
+
+        def forfeit(self):
+            self._call(self.arbiter.forfeit())
+
+        def ack(self, request, status, reason=None):
+            self._call(self.arbiter.ack(request, status, reason))
+
+        def _call(self, coroutine):
+            asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def __init__(self, agent):
+        self.agent = agent
+
+    def set_arbiter(self, arbiter):
+        self.agent.set_arbiter(self.Proxy(arbiter, asyncio.get_event_loop()))
+
+    async def new_game(self, field, **kwargs):
+        self.agent.new_game(field, **kwargs)
+
+    async def message(self, message, from_=None):
+        self.agent.message(message, from_)
+
+    async def move(self, m):
+        self.agent.move(m)
+
+    async def forfeit(self):
+        self.agent.forfeit()
+
+    async def undo(self):
+        self.agent.undo()
+
+    async def ack(self, request, status, reason=None):
+        self.agent.ack(request, status, reason)
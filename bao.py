@@ -5,23 +5,108 @@ findings by Tom Kronenburg, Jeroen Donkers, and Alex J. de Voogt in
 Never-Ending Moves in Bao (2006).
 '''
 import copy
+import random
 import sys
 
 
 INFINITE_MOVE_THRESHOLD = 500
 
+# Board cells are numbered row by row ('A', 'B', 'a', 'b') from column 1 to 8
+# with the two stores appended after the 32 holes.
+HOLES = tuple(r + c for r in 'ABab' for c in '12345678')
+STORE_AB = 32
+STORE_ab = 33
+N_CELLS = 34
+
+# Names reported to move watchers, indexed by cell number.
+CELL_NAMES = HOLES + ('A9', 'a9')
+
+HOLE_INDEX = dict((hole, i) for i, hole in enumerate(HOLES))
+HOLE_INDEX.update({'A9': STORE_AB, 'B9': STORE_AB,
+                   'a9': STORE_ab, 'b9': STORE_ab})
+
+# A field spans 16 cells starting at FIELD_BASE (front row then back row).
+FIELD_BASE = {'AB': 0, 'ab': 16}
+FIELD_STORE = {'AB': STORE_AB, 'ab': STORE_ab}
+
+
+def _make_topology():
+    rival_hole = tuple(i ^ 23 for i in range(STORE_AB))
+    next_hole = {'L': [], 'R': []}
+    capture_entry = {'L': [], 'R': []}
+    for i in range(STORE_AB):
+        col = i & 7
+        # Sowing step, rows alternate within a field at either end
+        next_hole['R'].append((i ^ 8, 'L') if col == 7 else (i + 1, 'R'))
+        next_hole['L'].append((i ^ 8, 'R') if col == 0 else (i - 1, 'L'))
+        # Seeds captured from hole i are sown from the capturer's kichwa
+        front = rival_hole[i] & 16
+        rival_col = rival_hole[i] & 7
+        for direction in 'LR':
+            if rival_col < 2:
+                entry = (front, 'R')
+            elif rival_col > 5:
+                entry = (front + 7, 'L')
+            elif direction == 'L':
+                entry = (front + 7, 'L')
+            else:
+                entry = (front, 'R')
+            capture_entry[direction].append(entry)
+    return (rival_hole,
+            dict((d, tuple(t)) for d, t in next_hole.items()),
+            dict((d, tuple(t)) for d, t in capture_entry.items()))
+
+# Hole topology tables indexed by cell number (holes only, not stores):
+#   RIVAL_HOLE[i]: the hole facing hole i on the rival field.
+#   NEXT_HOLE[direction][i]: (hole, direction) one sowing step after hole i.
+#   CAPTURE_ENTRY[direction][i]: (hole, direction) from which seeds captured
+#       from hole i are sown into the capturer's field.
+RIVAL_HOLE, NEXT_HOLE, CAPTURE_ENTRY = _make_topology()
+
+
+def _make_zobrist_keys(seed=0x6a09e667):
+    # Fixed seed, hashes must be stable across processes (eg for books)
+    rng = random.Random(seed)
+    seeds = tuple((0,) + tuple(rng.getrandbits(64) for _ in range(255))
+                  for _ in range(N_CELLS))
+    player = rng.getrandbits(64)
+    nyumba = dict((field, rng.getrandbits(64)) for field in ('AB', 'ab'))
+    takata = rng.getrandbits(64)
+    last_move_ending = dict((ending, rng.getrandbits(64))
+                            for ending in (None, 1, 2, 3, 4, 5))
+    return seeds, player, nyumba, takata, last_move_ending
+
+# Zobrist keys, ZOBRIST_SEEDS[i][n] is the key for n seeds in cell i (an
+# empty cell hashes to 0, hence so does an empty board).
+(ZOBRIST_SEEDS, ZOBRIST_PLAYER, ZOBRIST_NYUMBA, ZOBRIST_TAKATA,
+ ZOBRIST_LAST_MOVE_ENDING) = _make_zobrist_keys()
+
 
 class _Cursor(object):
     '''A Board iterator that loosely mimicks a human hand operating on a bao
     board.
+
+    The cursor's position is the cell number self.index, self.hole gives
+    the name of that cell.
     '''
 
     def __init__(self, board, hole, direction, stock):
         self.board = board
-        self.hole = hole
+        if isinstance(hole, int):
+            self.index = hole
+        else:
+            self.index = Board.hole_index(hole)
         self.stock = stock
         self.direction = direction
 
+    @property
+    def hole(self):
+        return CELL_NAMES[self.index]
+
+    @hole.setter
+    def hole(self, hole):
+        self.index = Board.hole_index(hole)
+
     def step(self):
         '''Move a single step in self.direction.
 
@@ -29,16 +114,9 @@ class _Cursor(object):
         self.direction is changed when the _Cursor steps out of bounds (ie
         beyond a8/A8 or a1/A1)
         '''
-        row, col = self.hole
-        if (col == '8' and self.direction == 'R'
-                or col == '1' and self.direction == 'L'):
-            self._switch_row_within_field()
-            self.reverse_direction()
-        elif self.direction == 'R':
-            self.hole = row + str(int(col) + 1)
-        elif self.direction == 'L':
-            self.hole = row + str(int(col) - 1)
-        else:
+        try:
+            self.index, self.direction = NEXT_HOLE[self.direction][self.index]
+        except (KeyError, IndexError):
             print(self.__dict__)
             raise RuntimeError(
                     '_Cursor: _Cursor.direction or _Cursor.hole is corrupted.')
@@ -49,23 +127,33 @@ class _Cursor(object):
         A count of less than 1 is interpreted as a capture all. No more
         than what is cursor's current position can be captured.
         '''
-        if count > self.board[self.hole]:
+        board = self.board
+        index = self.index
+        seeds = board.cells[index]
+        if count > seeds:
             raise ValueError('count exceeds seeds that can be captured')
         elif count < 0:
-            count = self.board[self.hole]
+            count = seeds
         self.stock += count
-        self.board[self.hole] -= count
+        board.cells[index] = seeds - count
+        board.hash ^= (ZOBRIST_SEEDS[index][seeds]
+                       ^ ZOBRIST_SEEDS[index][seeds - count])
 
     def sow(self, count=-1):
         '''Sow count nkhomo at current cursor's position.
-        
+
         A count of less than 1 is interpreted as a sow all. No more than
         what is in stock can be sown.
         '''
         if count == -1:
             count = self.stock
         self.stock -= count
-        self.board[self.hole] += count
+        board = self.board
+        index = self.index
+        seeds = board.cells[index]
+        board.cells[index] = seeds + count
+        board.hash ^= (ZOBRIST_SEEDS[index][seeds]
+                       ^ ZOBRIST_SEEDS[index][seeds + count])
 
     def reverse_direction(self):
         '''Reverse cursor's stepping direction.'''
@@ -79,30 +167,31 @@ class _Cursor(object):
 
     def switch_field(self):
         '''Jump to a hole on the rival field that rivals current hole.'''
-        self.hole = self.board.rival_hole(self.hole)
-
-    def _switch_row_within_field(self):
-        row, col = self.hole
-        if row == 'A':
-            self.hole = 'B' + col
-        elif row == 'B':
-            self.hole = 'A' + col
-        elif row == 'a':
-            self.hole = 'b' + col
-        elif row == 'b':
-            self.hole = 'a' + col
-        else:
-            raise RuntimeError('_Cursor: Invalid hole {}'.format(self.hole))
+        self.index = RIVAL_HOLE[self.index]
+
+    def enter_field(self):
+        '''Jump to the hole where seeds captured at the current position are
+        sown from in the rival field, direction is adjusted accordingly.'''
+        self.index, self.direction = CAPTURE_ENTRY[self.direction][self.index]
 
 
 class Board(object):
+    '''Seed counts for the 32 holes and 2 stores of a bao board.
+
+    Counts live in the bytearray Board.cells indexed by cell number (see
+    HOLES, STORE_AB and STORE_ab). Indexing a Board by hole name (eg
+    board['A5']) is kept for convenience, hot paths should use cells.
+
+    Board.hash is the Zobrist hash of the counts, it is kept up to date by
+    set_cell and _Cursor, cells must not be modified any other way.
+    '''
     def __init__(self, other=None):
         if other:
-            self._holes = other._holes.copy()
-            self._store = other._store.copy()
+            self.cells = bytearray(other.cells)
+            self.hash = other.hash
         else:
-            self._holes = dict((i + j, 0) for i in 'ABab' for j in '12345678')
-            self._store = {'ab': 0, 'AB': 0}
+            self.cells = bytearray(N_CELLS)
+            self.hash = 0
 
     def update(self, board_conf):
         for h, v in list(board_conf.items()):
@@ -110,12 +199,27 @@ class Board(object):
 
     def copy(self):
         return Board(self)
-        
+
     def cursor(self, hole, direction, stock):
         return _Cursor(self, hole, direction, stock)
 
     def holes(self):
-        return tuple(self._holes.keys()) + ('A9', 'B9', 'a9', 'b9')
+        return HOLES + ('A9', 'B9', 'a9', 'b9')
+
+    @staticmethod
+    def hole_index(hole):
+        '''Returns the cell number of hole.'''
+        try:
+            return HOLE_INDEX[hole]
+        except KeyError:
+            raise ValueError('Invalid hole: {}'.format(hole))
+
+    @staticmethod
+    def rival_index(index):
+        '''Returns the cell number of the hole that rivals cell index.'''
+        if not 0 <= index < STORE_AB:
+            raise ValueError('Invalid hole index: {}'.format(index))
+        return RIVAL_HOLE[index]
 
     @staticmethod
     def get_target_hole(move, n_steps):
@@ -164,53 +268,36 @@ class Board(object):
     @staticmethod
     def rival_hole(hole):
         '''Returns hole on rival field that rivals given hole.'''
-        row, col = hole
-        if row == 'A':
-            return 'a' + str(9 - int(col))
-        elif row == 'a':
-            return 'A' + str(9 - int(col))
-        elif row == 'B':
-            return 'b' + str(9 - int(col))
-        elif row == 'b':
-            return 'B' + str(9 - int(col))
-        else:
+        index = HOLE_INDEX.get(hole, STORE_AB)
+        if index >= STORE_AB:
             raise ValueError('Invalid hole {}'.format(hole))
-
+        return HOLES[RIVAL_HOLE[index]]
+
+    def get_row_features(self, field):
+        '''Returns (front row seeds, back row seeds, empty front row holes,
+        back row holes with less than 2 seeds) for field.'''
+        base = FIELD_BASE[field]
+        front_row = self.cells[base:base + 8]
+        back_row = self.cells[base + 8:base + 16]
+        return (sum(front_row),
+                sum(back_row),
+                front_row.count(0),
+                back_row.count(0) + back_row.count(1))
 
     def __getitem__(self, hole):
-        return self._grep_hole(hole,
-                               lambda : self._store['ab'],
-                               lambda : self._store['AB'],
-                               lambda : self._holes[hole])
-        
+        return self.cells[self.hole_index(hole)]
+
     def __setitem__(self, hole, value):
-        def set_store(i, value):
-            self._store[i] = value
-
-        def set_hole(i, value):
-            self._holes[i] = value
-
-        self._grep_hole(hole,
-                        lambda : set_store('ab', value),
-                        lambda : set_store('AB', value),
-                        lambda : set_hole(hole, value))
-
-    def _grep_hole(self, hole, fn_store_ab, fn_store_AB, fn_other):
-        # Name's quite unfortunate...
-        if hole[1] == '9':
-            if hole[0] in 'ab':
-                return fn_store_ab()
-            elif hole[0] in 'AB':
-                return fn_store_AB()
-            else:
-                raise ValueError('Invalid hole: {}'.format(hole))
-        elif hole in self._holes:
-            return fn_other()
-        else:
-            raise ValueError('Invalid hole: {}'.format(hole))
+        self.set_cell(self.hole_index(hole), value)
+
+    def set_cell(self, index, value):
+        '''Set seeds in cell index to value.'''
+        self.hash ^= (ZOBRIST_SEEDS[index][self.cells[index]]
+                      ^ ZOBRIST_SEEDS[index][value])
+        self.cells[index] = value
 
     def __str__(self):
-        return str(self.__dict__)
+        return str(dict(zip(CELL_NAMES, self.cells)))
 
     __repr__ = __str__
 
@@ -262,7 +349,9 @@ class State(object):
             self.player = other.player
             self.rules = other.rules
             self._last_move_ending = other._last_move_ending
-            self._transitions = {}
+            self._moves = None
+            self._children = {}
+            self._blocked = None
         elif 'rules' in kwargs:
             rules = copy.deepcopy(kwargs['rules'])
             self.board = Board()
@@ -276,13 +365,23 @@ class State(object):
                 self.player = rules.player_starting
             self.rules = rules
             self._last_move_ending = None # How the last move ended...
-            self._transitions = {}
+            self._moves = None      # Legal moves, generated on demand
+            self._children = {}     # move -> child State or None if long move
+            self._blocked = None    # See is_blocked, None until known
         else:
             raise ValueError("State must be instantiated with rules")
 
     def copy(self):
         return State(other=self)
 
+    def __getstate__(self):
+        # Pickle the position only, cached moves and children are rebuilt
+        # on demand.
+        state = self.__dict__.copy()
+        state['_moves'] = None
+        state['_children'] = {}
+        return state
+
     def get_board(self):
         return self.board.copy()
 
@@ -295,6 +394,23 @@ class State(object):
     def get_player(self):
         return self.player
 
+    def get_hash(self):
+        '''Returns the Zobrist hash of this state.
+
+        The hash covers seed counts, nyumba flags, the player to move, the
+        takata status and how the last move ended.
+        '''
+        key = self.board.hash ^ ZOBRIST_LAST_MOVE_ENDING[self._last_move_ending]
+        if self.player == 'ab':
+            key ^= ZOBRIST_PLAYER
+        if self.nyumba['AB']:
+            key ^= ZOBRIST_NYUMBA['AB']
+        if self.nyumba['ab']:
+            key ^= ZOBRIST_NYUMBA['ab']
+        if self.is_takata():
+            key ^= ZOBRIST_TAKATA
+        return key
+
     def get_takasia(self):
         return self.takasia
 
@@ -302,24 +418,56 @@ class State(object):
         return copy.deepcopy(self.rules)
 
     def get_moves(self):
-        return list(self._get_transitions_dict().keys())
+        '''Returns legal moves, long moves included.
+
+        Moves are classified without being executed, use get_child or
+        is_long_move to find out whether a move is a long move.
+        '''
+        return list(self._get_moves())
 
     def get_transitions(self):
-        return list(self._get_transitions_dict().items())
+        '''Returns (move, child) pairs for all moves, executing each move.
+
+        child is None for long moves.
+        '''
+        return [(move, self.get_child(move)) for move in self._get_moves()]
 
     def get_child(self, move):
+        '''Returns the State move leads to or None if move is a long move.
+
+        Children are built on first request and cached.
+        '''
+        moves = self._get_moves()
         try:
-            return self._get_transitions_dict()[move]
+            return self._children[move]
         except KeyError:
-            raise InvalidMoveError()
+            if move not in moves:
+                raise InvalidMoveError()
+        child = self.copy()
+        if not child._exec_move(Move(move)):
+            child = None    # Long move
+        self._children[move] = child
+        return child
+
+    def is_long_move(self, move):
+        return self.get_child(move) is None
+
+    def get_capture_size(self, move):
+        '''Returns seeds move captures on its first capture (0 if move is not
+        a mtaji move), the move is not executed.'''
+        hole, direction, mod = Move.split_move(move)
+        if mod or not self.is_mtaji() or move not in self._get_moves():
+            return 0
+        return self._get_first_capture(HOLE_INDEX[hole], direction,
+                                       self.in_namua_phase())
 
     def get_closest_move(self, move):
-        transitions = self._get_transitions_dict()
-        if move in transitions:
+        moves = self._get_moves()
+        if move in moves:
             return move
-        elif move + '>' in transitions:
+        elif move + '>' in moves:
             return move + '>'
-        elif move + '$' in transitions:
+        elif move + '$' in moves:
             return move + '$'
         else:
             return None
@@ -329,6 +477,33 @@ class State(object):
             raise LongMoveError()
         return self._exec_move(move, *args, **kwargs)
 
+    def make_move(self, move):
+        '''Execute move in place, returns an undo record for unmake_move.
+
+        Meant for searches walking the game tree on a single State. Returns
+        None and leaves the state untouched if move is a long move.
+        '''
+        if move not in self._get_moves():
+            raise InvalidMoveError()
+        # Copying the 34 cells in one go is cheaper than logging every sow
+        undo = (bytes(self.board.cells), self.board.hash,
+                self.nyumba['AB'], self.nyumba['ab'], self.takata,
+                self.takasia, self.player, self._last_move_ending,
+                self._moves, self._children, self._blocked)
+        if self._exec_move(Move(move)):
+            return undo
+        self.unmake_move(undo)
+        return None
+
+    def unmake_move(self, undo):
+        '''Take back the move make_move returned undo for.'''
+        (cells, self.board.hash, nyumba_AB, nyumba_ab, self.takata,
+         self.takasia, self.player, self._last_move_ending, self._moves,
+         self._children, self._blocked) = undo
+        self.board.cells[:] = cells
+        self.nyumba['AB'] = nyumba_AB
+        self.nyumba['ab'] = nyumba_ab
+
     def is_valid_move(self, move):
         if self.get_closest_move(move):
             return True
@@ -336,115 +511,148 @@ class State(object):
             return False
 
     def is_takata(self):
-        if not self._transitions: # takata flag may not have been set
-            self._get_transitions_dict()
+        if self._moves is None: # takata flag may not have been set
+            self._get_moves()
         return self.takata
 
     def is_mtaji(self):
         return not self.is_takata()
 
     def in_namua_phase(self):
-        return self.board[self.player[0] + '9'] > 0
+        return self.board.cells[FIELD_STORE[self.player]] > 0
 
     def in_mtaji_phase(self):
-        return self.board[self.player[0] + '9'] == 0
+        return self.board.cells[FIELD_STORE[self.player]] == 0
+
+    def is_blocked(self):
+        '''Test if the player to move has nothing to sow: an empty front row
+        or, in the mtaji phase, no hole holding 2 or more seeds.
+
+        A blocked player has lost. No move is generated or executed, the
+        flag is worked out from the player's field on the first call after
+        a move (and restored by unmake_move).
+        '''
+        if self._blocked is None:
+            self._blocked = self._is_blocked()
+        return self._blocked
 
     def is_game_over(self):
         '''Test for gameover for current player (ie if the player has no legal
         moves)'''
-        if [_f for _f in list(self._get_transitions_dict().values()) if _f]:
-            return False
-        else:
+        if self.is_blocked():
             return True
+        for move in self._get_moves():
+            if move in self._children:
+                if self._children[move] is not None:
+                    return False
+            else:
+                # Executing in place is enough, no need to keep a child
+                undo = self.make_move(move)
+                if undo is not None:
+                    self.unmake_move(undo)
+                    return False
+                self._children[move] = None
+        return True
 
 # private:
     def _exec_move(self, move, move_watcher=lambda h, v: None):
         hole, direction, mod = Move.split_move(move)
+        cells = self.board.cells
+        base = FIELD_BASE[self.player]
+        index = HOLE_INDEX.get(hole, -1)
 
-        if (not self.board.hole_in_field(hole, self.player)
-                or self.board[hole] == 0):
+        if not base <= index < base + 16 or cells[index] == 0:
             return False
         elif mod == '$':
             self._last_move_ending = MTAJI_STOP
             self._setup_for_next_player()
             return True
         elif self.in_namua_phase():
-            if hole[0] == 'b' or hole[0] == 'B':
+            store = FIELD_STORE[self.player]
+            if index >= base + 8:
                 return False
-            elif hole[1] == '5' and self.nyumba[self.player]:
+            elif index == base + 4 and self.nyumba[self.player]:
                 if self.takata and mod != '>':
                     # tax the nyumba
-                    store = hole[0] + '9'
-                    self.board[store] -= 1
-                    move_watcher(store, self.board[store])
-                    cursor = self.board.cursor(hole, direction, 1)
+                    self.board.set_cell(store, cells[store] - 1)
+                    move_watcher(CELL_NAMES[store], cells[store])
+                    cursor = self.board.cursor(index, direction, 1)
                     cursor.capture(1)
-                    move_watcher(hole, self.board[hole])
+                    move_watcher(hole, cells[index])
                     cursor.step()
                     return self._exec_move_iter(cursor, 2, move_watcher)
                 elif mod == '>':
-                    cursor = self.board.cursor(hole, direction, 0)
+                    cursor = self.board.cursor(index, direction, 0)
                     self.nyumba[self.player] = False
                     return self._exec_move_iter(cursor, 0, move_watcher)
                 else:
-                    store = hole[0] + '9'
-                    self.board[store] -= 1
-                    move_watcher(store, self.board[store])
-                    cursor = self.board.cursor(hole, direction, 1)
+                    self.board.set_cell(store, cells[store] - 1)
+                    move_watcher(CELL_NAMES[store], cells[store])
+                    cursor = self.board.cursor(index, direction, 1)
                     return self._exec_move_iter(cursor, 1, move_watcher)
             else:
-                store = hole[0] + '9'
-                self.board[store] -= 1
-                move_watcher(store, self.board[store])
-                cursor = self.board.cursor(hole, direction, 1)
+                self.board.set_cell(store, cells[store] - 1)
+                move_watcher(CELL_NAMES[store], cells[store])
+                cursor = self.board.cursor(index, direction, 1)
                 return self._exec_move_iter(cursor, 1, move_watcher)
-        elif (self.board[hole] == 1
-                  or ((hole == 'A5' or hole == 'a5')
+        elif (cells[index] == 1
+                  or (index == base + 4
                           and self.nyumba[self.player]
                           and mod != '>')):
             return False
         else:
-            cursor = self.board.cursor(hole, direction, 0)
+            cursor = self.board.cursor(index, direction, 0)
             cursor.capture()
-            if hole in ('a5', 'A5') and self.nyumba[self.player]:
+            if index == base + 4 and self.nyumba[self.player]:
                 self.nyumba[self.player] = False
             cursor.step()
-            move_watcher(hole, self.board[hole])
+            move_watcher(hole, cells[index])
             return self._exec_move_iter(cursor, 1, move_watcher)
 
     def _exec_move_iter(self, cursor, steps_execd, move_watcher):
+        cells = self.board.cells
+        base = FIELD_BASE[self.player]
+        front_row_end = base + 8
+        field_end = base + 16
+        nyumba = base + 4
+        rival_hole = RIVAL_HOLE
+        opponent = Board.rival_field(self.player)
+        if self.takasia is None:
+            takasia = -1
+        else:
+            takasia = HOLE_INDEX[self.takasia]
+
         while True:
             if steps_execd > INFINITE_MOVE_THRESHOLD:
                 sys.stderr.write('Error: Possible infinite mtaji move\n')
                 # raise LongMoveError()
                 return False
+            index = cursor.index
             if self.takata and steps_execd >= self.rules.long_move_limit:
                 return False
-            elif self.board.hole_in_field(cursor.hole, self.player):
+            elif base <= index < field_end:
                 if cursor.stock == 0:
-                    if self.board[cursor.hole] == 1:
+                    if cells[index] == 1:
                         if self.takata:
                             self._last_move_ending = TAKATA_STOP
                             break
                         else:
                             self._last_move_ending = MTAJI_STOP
                             break
-                    elif (cursor.hole[0] == self.player[0]
-                            and self.board[self.board.rival_hole(cursor.hole)]
+                    elif (index < front_row_end
+                            and cells[rival_hole[index]]
                             and not self.takata):
                         cursor.switch_field()
                         cursor.capture()
                         if cursor.stock == 0:
                             cursor.switch_field()
                             cursor.capture()
-                        elif cursor.hole[1] == '5':
-                            opponent = self.board.rival_field(self.player)
+                        elif cursor.index & 7 == 4:
                             self.nyumba[opponent] = False
-                    elif cursor.hole == self.takasia and self.takata:
+                    elif index == takasia and self.takata:
                         self._last_move_ending = TAKASIA_STOP
                         break
-                    elif ((cursor.hole == 'A5' or cursor.hole == 'a5')
-                            and self.nyumba[self.player]):
+                    elif index == nyumba and self.nyumba[self.player]:
                         if self.takata:
                             self._last_move_ending = TAKATA_STOP
                             break
@@ -459,156 +667,140 @@ class State(object):
                 else:
                     cursor.sow(1)
             else:
-                cursor.switch_field()
-                if cursor.hole in ('A1', 'A2', 'a1', 'a2'):
-                    cursor.hole = cursor.hole[0] + '1'
-                    cursor.direction = 'R'
-                elif cursor.hole in ('A7', 'A8', 'a7', 'a8'):
-                    cursor.hole = cursor.hole[0] + '8'
-                    cursor.direction = 'L'
-                elif cursor.direction == 'L':
-                    cursor.hole = cursor.hole[0] + '8'
-                else:
-                    cursor.hole = cursor.hole[0] + '1'
+                cursor.enter_field()
                 continue
 
-            move_watcher(cursor.hole, self.board[cursor.hole])
+            index = cursor.index
+            move_watcher(CELL_NAMES[index], cells[index])
 
-            if cursor.stock and cursor.hole[0] in self.player:
+            if cursor.stock and base <= index < field_end:
                 cursor.step()
             steps_execd += 1
         self._setup_for_next_player()
         return True
 
-    def _get_transitions_dict(self):
-        if not self._transitions:
-            self._update_transitions()
-        return self._transitions
+    def _get_moves(self):
+        if self._moves is None:
+            self._update_moves()
+        return self._moves
 
-    def _update_transitions(self):
+    def _update_moves(self):
         # Moves are _updated in the following order:
         #   (1) Mtaji moves
         #   (2) Front row takatas if (1) fails
         #   (3) Nyumba takata if in namua stage and (2) fails
         #   (4) Back row takatas if in mtaji stage and (2) fails
         #   (5) Nyumba takata if in mtaji stage and (4) fails
-        self._updated = True
+        # Moves are only classified here, children are built by get_child.
+        moves = self._moves = []
+        self._children = {}
         if self._last_move_ending == LSOW_NYUMBA_STOP:
-            for move in (self.player[0] + '5L>', self.player[0] + '5-$'):
-                self.takata = False
-                child = self.copy()
-                move = Move(move)
-                child._exec_move(move)
-                self._transitions[move] = child
+            self.takata = False
+            moves.append(Move(self.player[0] + '5L>'))
+            moves.append(Move(self.player[0] + '5-$'))
             return True
         elif self._last_move_ending == RSOW_NYUMBA_STOP:
-            for move in (self.player[0] + '5R>', self.player[0] + '5-$'):
-                self.takata = False
-                child = self.copy()
-                move = Move(move)
-                child._exec_move(move)
-                self._transitions[move] = child
+            self.takata = False
+            moves.append(Move(self.player[0] + '5R>'))
+            moves.append(Move(self.player[0] + '5-$'))
             return True
 
+        cells = self.board.cells
+        base = FIELD_BASE[self.player]
+        nyumba = base + 4
+        namua_phase = self.in_namua_phase()
+
         self.takata = True
         nyumba_takata = False
         back_row_takata = False
         front_row_takata = False
         front_row_is_empty = True
-        
-        for move in (h + d for d in 'LR'
-                           for h in self.board.holes()
-                           if self.board.hole_in_field(h, self.player)
-                                and h[1] != '9'):
-            hole, direction, mod = Move.split_move(move)
-
-            if (front_row_is_empty and self.board.hole_in_front_row(hole)
-					and self.board[hole]):
-                front_row_is_empty = False
-
-            if not self._is_possible_move(move):
-                continue
-            elif self._is_mtaji_move(move):
-                if self.takata:
-                    self.takata = False
-                    self._transitions.clear()
-            elif not self.takata:
-                continue
-            elif self.board.hole_in_front_row(hole):
-                if (hole[1] == '5' and self.nyumba[self.player]):
-                    if self.in_namua_phase():
-                        if front_row_takata:
-                            continue
-                        elif not nyumba_takata:
-                            nyumba_takata = True
-                            self._transitions.clear()
-                        if self.board[hole] < self.rules.board_config[hole]:
-                            # Nyumba has fewer than the minimum number of seeds
-                            # for takasa, nyumba must be sown
+
+        for direction in 'LR':
+            for index in range(base, base + 16):
+                in_front_row = index < base + 8
+
+                if front_row_is_empty and in_front_row and cells[index]:
+                    front_row_is_empty = False
+
+                if not self._is_possible_move(index, namua_phase):
+                    continue
+                elif self._is_mtaji_move(index, direction, namua_phase):
+                    if self.takata:
+                        self.takata = False
+                        del moves[:]
+                    move = HOLES[index] + direction
+                elif not self.takata:
+                    continue
+                elif in_front_row:
+                    move = HOLES[index] + direction
+                    if index == nyumba and self.nyumba[self.player]:
+                        if namua_phase:
+                            if front_row_takata:
+                                continue
+                            elif not nyumba_takata:
+                                nyumba_takata = True
+                                del moves[:]
+                            if (cells[index]
+                                    < self.rules.board_config[HOLES[index]]):
+                                # Nyumba has fewer than the minimum number of
+                                # seeds for takasa, nyumba must be sown
+                                move += '>'
+                        else:
+                            if not nyumba_takata:
+                                front_row_takata = True
+                                nyumba_takata = True
+                                del moves[:]
                             move += '>'
-                    else:
-                        if not nyumba_takata:
-                            front_row_takata = True
-                            nyumba_takata = True
-                            self._transitions.clear()
-                        move += '>'
-                elif nyumba_takata and self.in_mtaji_phase():
-                    continue    # nyumba_takata takes precedence in mtaji phase
-                elif not front_row_takata:
-                    front_row_takata = True
-                    self._transitions.clear()
-            elif front_row_takata:
-                continue
-            elif not back_row_takata:
-                back_row_takata = True
-                self._transitions.clear()
+                    elif nyumba_takata and not namua_phase:
+                        continue    # nyumba_takata takes precedence in mtaji phase
+                    elif not front_row_takata:
+                        front_row_takata = True
+                        del moves[:]
+                elif front_row_takata:
+                    continue
+                else:
+                    move = HOLES[index] + direction
+                    if not back_row_takata:
+                        back_row_takata = True
+                        del moves[:]
 
-            child = self.copy()
-            move = Move(move)
-            if child._exec_move(move):
-                self._transitions[move] = child
-            else: # Long move
-                self._transitions[move] = None
+                moves.append(Move(move))
 
         if front_row_is_empty:
-            self._transitions.clear()
+            del moves[:]
 
-        return bool(self._transitions)
+        return bool(moves)
 
-    def _is_possible_move(self, move):
-        hole, direction, mod = Move.split_move(move)
-        if self.in_namua_phase():
-            if self.board.hole_in_back_row(hole) or self.board[hole] == 0:
-                return False
-            else:
-                return True
+    def _is_possible_move(self, index, namua_phase):
+        if namua_phase:
+            return index & 8 == 0 and self.board.cells[index] > 0
         else:
-            if self.board[hole] > 1:
-                return True
-            else:
-                return False
-
-    def _is_mtaji_move(self, move):
-        hole, direction, mod = Move.split_move(move)
-        if self.in_namua_phase():
-            if (self.board.hole_in_front_row(hole)
-                    and self.board[hole]
-                    and self.board[self.board.rival_hole(hole)]):
-                return True
-            else:
-                return False
+            return self.board.cells[index] > 1
+
+    def _is_mtaji_move(self, index, direction, namua_phase):
+        return self._get_first_capture(index, direction, namua_phase) > 0
+
+    def _get_first_capture(self, index, direction, namua_phase):
+        # Returns seeds in the hole a move from index would capture first,
+        # 0 if the move is not a capture.
+        cells = self.board.cells
+        if namua_phase:
+            if index & 8 == 0 and cells[index]:
+                return cells[RIVAL_HOLE[index]]
+            return 0
         else:
-            if (self.board[hole] < 2
-                    or self.board[hole] > self.rules.max_seeds_for_mtaji):
-                return False
-            end_hole = self.board.get_marker_hole(hole + direction,
-                                                  self.board[hole])
-            if (self.board.hole_in_front_row(end_hole)
-                    and self.board[end_hole]
-                    and self.board[self.board.rival_hole(end_hole)]):
-                return True
-            else:
-                return False
+            seeds = cells[index]
+            if seeds < 2 or seeds > self.rules.max_seeds_for_mtaji:
+                return 0
+            end_hole = index
+            next_hole = NEXT_HOLE
+            while seeds:
+                end_hole, direction = next_hole[direction][end_hole]
+                seeds -= 1
+            if end_hole & 8 == 0 and cells[end_hole]:
+                return cells[RIVAL_HOLE[end_hole]]
+            return 0
 
     def _setup_for_next_player(self):
         if self.takata and not self.in_namua_phase() and self.rules.use_takasia:
@@ -619,7 +811,17 @@ class State(object):
         else:
             self.takata = True
             self.player = self.board.rival_field(self.player)
-        self._transitions.clear()
+        self._moves = None
+        self._children = {}
+        self._blocked = None
+
+    def _is_blocked(self):
+        cells = self.board.cells
+        base = FIELD_BASE[self.player]
+        if not any(cells[base:base + 8]):
+            return True
+        return (not cells[FIELD_STORE[self.player]]
+                and max(cells[base:base + 16]) < 2)
 
     def _update_takasia(self):
         self.takasia = None
@@ -693,7 +895,7 @@ class History(object):
         if len(self._nodes) > 1:
             node = self._nodes.pop()
             for watcher in self._watchers:
-                watcher(node, self.pop)
+                watcher(node, self.pop_node)
             return node
         else:
             return self._nodes[0]
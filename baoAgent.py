@@ -43,3 +43,38 @@ class BaoAgent(object):
         '''
         pass
 
+
+
+class AsyncBaoAgent(object):
+    '''BaoAgent for asyncio, the same interface with coroutine methods.
+
+    Agents must not block the event loop: long running work (like a
+    search) belongs in an executor or a task of its own, a coroutine
+    should return as soon as the request is taken in.
+    '''
+    def set_arbiter(self, arbiter):
+        '''Set arbiter which must be an AsyncBaoAgent.'''
+        pass
+
+    async def new_game(self, field, **kwargs):
+        pass
+
+    async def message(self, message, from_=None):
+        '''Send message to agent (see BaoAgent.message).'''
+        pass
+
+    async def move(self, m):
+        '''Send move made to agent.'''
+        pass
+
+    async def forfeit(self):
+        '''Notify agent of forfeit.'''
+        pass
+
+    async def undo(self):
+        '''Request agent to undo last move.'''
+        pass
+
+    async def ack(self, request, status, reason=None):
+        '''Report whether a previous request failed (see BaoAgent.ack).'''
+        pass
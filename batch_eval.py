@@ -0,0 +1,88 @@
+'''Batched leaf evaluation with NumPy.
+
+evaluate scores many positions in one call, exactly as Malume.eval_state
+scores them one at a time. Positions are passed as an (N, 34) array of
+board cells (see bao.Board.cells) along with the player to move, whether
+the player is in mtaji (see bao.State.is_mtaji) and whose point of view
+the score is from. Positions that are game over are not handled, eval_state
+does not look at the board for those.
+
+NumPy is optional, Malume only uses this module if NumPy can be imported.
+'''
+import numpy
+
+import bao
+
+# Player encoding for the players and max_players arrays
+PLAYERS = ('AB', 'ab')
+
+
+def get_cells(rows):
+    '''Returns an (N, 34) array of a sequence of board cells.'''
+    return numpy.frombuffer(b''.join(rows),
+                            dtype=numpy.uint8).reshape(-1, bao.N_CELLS)
+
+
+def encode(states):
+    '''Returns (cells, players, mtaji) arrays for a sequence of States.'''
+    cells = get_cells([bytes(s.board.cells) for s in states])
+    players = numpy.array([PLAYERS.index(s.get_player()) for s in states],
+                          dtype=numpy.int8)
+    mtaji = numpy.array([s.is_mtaji() for s in states], dtype=bool)
+    return cells, players, mtaji
+
+
+def _get_row_features(cells, field):
+    # Vectorized bao.Board.get_row_features
+    base = bao.FIELD_BASE[field]
+    front_row = cells[:, base:base + 8]
+    back_row = cells[:, base + 8:base + 16]
+    return (front_row.sum(axis=1),
+            back_row.sum(axis=1),
+            (front_row == 0).sum(axis=1),
+            (back_row < 2).sum(axis=1))
+
+
+def evaluate(cells, players, mtaji, max_players):
+    '''Returns eval_state's scores for a batch of positions as an int64
+    array.
+
+    cells is an (N, 34) array of seed counts, players the player to move
+    (index into PLAYERS), mtaji whether that player is in mtaji and
+    max_players the player to score for (an index or array of indices).
+    '''
+    cells = numpy.asarray(cells, dtype=numpy.int64)
+    is_AB = numpy.asarray(players) == 0
+    features = {'AB': _get_row_features(cells, 'AB'),
+                'ab': _get_row_features(cells, 'ab')}
+    own = [numpy.where(is_AB, AB, ab)
+           for AB, ab in zip(features['AB'], features['ab'])]
+    rival = [numpy.where(is_AB, ab, AB)
+             for AB, ab in zip(features['AB'], features['ab'])]
+    store = numpy.where(is_AB, cells[:, bao.STORE_AB], cells[:, bao.STORE_ab])
+    rival_store = numpy.where(is_AB, cells[:, bao.STORE_ab],
+                              cells[:, bao.STORE_AB])
+    front_seeds, back_seeds = own[0], own[1]
+    empty_fronts, weak_backs = rival[2], rival[3]
+
+    # Same terms in the same order as eval_state so that the floating point
+    # results agree to the bit
+    score = 0.5 * front_seeds + back_seeds + 1.5 * store
+    namua_terms = 1.5 * (empty_fronts + (rival_store == 0))
+    mtaji_terms = (8 + empty_fronts + weak_backs
+                   + numpy.where(rival_store == 0, 2, 1)
+                   + (rival_store < 2))
+    score = score + numpy.where(store > 0, namua_terms, mtaji_terms)
+    score = numpy.where(mtaji, score * 1.5, score)
+
+    scores = numpy.trunc(score).astype(numpy.int64)
+    return numpy.where(numpy.asarray(players) == max_players, scores, -scores)
+
+
+def evaluate_states(states, max_player):
+    '''Returns eval_state(state, max_player, depth) for each of states as a
+    list, none of states may be game over.'''
+    if not states:
+        return []
+    cells, players, mtaji = encode(states)
+    return evaluate(cells, players, mtaji, PLAYERS.index(max_player)).tolist()
@@ -1,7 +1,6 @@
 from tkinter import *
 from tkinter.ttk import *
 
-import os
 import random
 
 import theme
@@ -24,6 +23,10 @@ class BoardView(Canvas):
         self.hole_id_to_name = {}
         self.hole_id_to_def = {}
         self.hole_id_to_value_id = {}
+        # Seed items are pooled, hidden rather than deleted (see update_seeds)
+        self.hole_id_to_value = {}
+        self.hole_id_to_seed_ids = {}
+        self.hole_id_to_seed_positions = {}
 
         self.poll_moves = True
         self.move_pivot_hole = None
@@ -33,16 +36,13 @@ class BoardView(Canvas):
         self.set_theme('default')
 
     def get_themes(self):
-        themes = set()
-        for f in os.listdir(theme.THEME_DIR_PATH):
-            if f.startswith('.'):
-                continue
-            themes.add(os.path.splitext(f)[0])
-        return iter(themes)
+        return iter(theme.get_theme_names())
 
     def set_theme(self, t, board=None):
-        self.theme = theme.get_theme(t)
-        self.load_theme()
+        new_theme = theme.get_theme(t)
+        if new_theme is not getattr(self, 'theme', None):
+            self.theme = new_theme
+            self.load_theme()
         if board:
             self.update(board)
 
@@ -69,26 +69,54 @@ class BoardView(Canvas):
             self.update_hole(hole, board[hole])
 
     def update_hole(self, hole, value):
+        value = int(value)
+        hole_id = self.hole_name_to_id[hole]
+        if self.hole_id_to_value.get(hole_id) == value:
+            return None
         if 'seed' in self.theme['board']:
+            self.update_seeds(hole_id, value)
+        self.hole_id_to_value[hole_id] = value
+        self.itemconfigure(self.hole_id_to_value_id[hole_id], text=value)
+
+    def update_seeds(self, hole_id, value):
+        # Only the difference between the seeds shown and value is drawn,
+        # seed items are created once and then shown or hidden.
+        seed_ids = self.hole_id_to_seed_ids.setdefault(hole_id, [])
+        shown = self.hole_id_to_value.get(hole_id, 0)
+        if value > len(seed_ids):
             s_def = self.theme['board']['seed']
-            h_def = self.theme['board']['holes'][hole]
-            h_tag = 'seed_' + hole
-            self.delete(h_tag)
-            for i in range(value):
-                x = random.randint(int(0.3 * h_def['select_image'].width()),
-                                   int(0.7 * h_def['select_image'].width()))
-                y = random.randint(int(0.3 * h_def['select_image'].height()),
-                                   int(0.7 * h_def['select_image'].height()))
-                self.create_image(h_def['x'] + x,
-                                  h_def['y'] + y,
-                                  image=s_def['image'],
-                                  anchor=NW,
-                                  tags=(h_tag,))
-                self.tag_lower(h_tag, self.hole_name_to_id[hole])
-                
-        self.itemconfigure(self.hole_id_to_value_id[self.hole_name_to_id[hole]],
-                           text=value)
-        
+            h_def = self.hole_id_to_def[hole_id]
+            h_tag = 'seed_{}'.format(hole_id)
+            positions = self.get_seed_positions(hole_id, value)
+            for x, y in positions[len(seed_ids):]:
+                seed_ids.append(self.create_image(h_def['x'] + x,
+                                                  h_def['y'] + y,
+                                                  image=s_def['image'],
+                                                  anchor=NW,
+                                                  state=HIDDEN,
+                                                  tags=(h_tag, 'seed')))
+            self.tag_lower(h_tag, hole_id)
+        for seed_id in seed_ids[shown:value]:
+            self.itemconfigure(seed_id, state=NORMAL)
+        for seed_id in seed_ids[value:shown]:
+            self.itemconfigure(seed_id, state=HIDDEN)
+
+    def get_seed_positions(self, hole_id, n_seeds):
+        '''Returns at least n_seeds seed positions within hole_id, relative
+        to the hole, the same ones every time.'''
+        positions = self.hole_id_to_seed_positions.setdefault(hole_id, [])
+        if len(positions) < n_seeds:
+            h_def = self.hole_id_to_def[hole_id]
+            width = h_def['select_image'].width()
+            height = h_def['select_image'].height()
+            rng = random.Random(hole_id + len(positions))
+            while len(positions) < n_seeds:
+                positions.append((rng.randint(int(0.3 * width),
+                                              int(0.7 * width)),
+                                  rng.randint(int(0.3 * height),
+                                              int(0.7 * height))))
+        return positions
+
 
     def highlight_hole(self, hole):
         hole_id = self.hole_name_to_id[hole]
@@ -148,32 +176,35 @@ class BoardView(Canvas):
         self.itemconfigure(self.field_labels['ab'], text='ab')
 
     def load_theme(self):
+        # Items are created for the first theme, later themes move and
+        # reconfigure them. Seeds are drawn again on the next update.
+        self.delete('seed')
+        self.hole_id_to_value = {}
+        self.hole_id_to_seed_ids = {}
+        self.hole_id_to_seed_positions = {}
+
         width = self.theme['board']['image'].width()
         height = self.theme['board']['image'].height()
 
         self.configure(width=width, height=height)
-        self.create_rectangle(0, 0, width, height, fill=self.cget('bg'))
-        self.create_image(0,
-                          0,
-                          image=self.theme['board']['image'],
-                          anchor=NW,
-                          tags=('board',))
-        self.create_text(self.theme['notification_area']['x'],
-                         self.theme['notification_area']['y'],
-                         anchor=NW,
-                         text=None,
-                         tags=('note',))
-        self.field_labels = {'ab': 'north_label', 'AB': 'south_label'}
-        self.create_text(self.theme['field_label']['ab']['x'],
-                         self.theme['field_label']['ab']['y'],
-                         text='ab',
-                         anchor=SW,
-                         tags=(self.field_labels['ab'],))
-        self.create_text(self.theme['field_label']['AB']['x'],
-                         self.theme['field_label']['AB']['y'],
-                         text='AB',
-                         anchor=NW,
-                         tags=(self.field_labels['AB'],))
+        if not self.find_withtag('board'):
+            self.create_rectangle(0, 0, width, height, fill=self.cget('bg'),
+                                  tags=('background',))
+            self.create_image(0, 0, anchor=NW, tags=('board',))
+            self.create_text(0, 0, anchor=NW, text=None, tags=('note',))
+            self.field_labels = {'ab': 'north_label', 'AB': 'south_label'}
+            self.create_text(0, 0, text='ab', anchor=SW,
+                             tags=(self.field_labels['ab'],))
+            self.create_text(0, 0, text='AB', anchor=NW,
+                             tags=(self.field_labels['AB'],))
+        self.coords('background', 0, 0, width, height)
+        self.itemconfigure('board', image=self.theme['board']['image'])
+        self.coords('note', self.theme['notification_area']['x'],
+                    self.theme['notification_area']['y'])
+        for field, label in list(self.field_labels.items()):
+            self.coords(label, self.theme['field_label'][field]['x'],
+                        self.theme['field_label'][field]['y'])
+            self.itemconfigure(label, anchor=SW if field == 'ab' else NW)
 
         for hole, hole_def in list(self.theme['board']['holes'].items()):
             if hole == 'b9' or hole == 'B9':
@@ -189,19 +220,28 @@ class BoardView(Canvas):
                               + hole_def['select_image'].width() / 2)
                 value_id_y = (hole_def['y']
                               + hole_def['select_image'].height() / 2)
-            value_id = self.create_text(value_id_x,
-                                        value_id_y,
-                                        text='0',
-                                        anchor=CENTER,
-                                        font=self.font)
 
-            hole_id = self.create_image(hole_def['x'],
-                                        hole_def['y'],
-                                        image=hole_def['deselect_image'],
-                                        anchor=NW)
+            hole_id = self.hole_name_to_id.get(hole)
+            if hole_id is None:
+                value_id = self.create_text(value_id_x,
+                                            value_id_y,
+                                            text='0',
+                                            anchor=CENTER,
+                                            font=self.font)
+
+                hole_id = self.create_image(hole_def['x'],
+                                            hole_def['y'],
+                                            image=hole_def['deselect_image'],
+                                            anchor=NW)
+                self.set_hole_bindings(hole_id)
+            else:
+                value_id = self.hole_id_to_value_id[hole_id]
+                self.coords(value_id, value_id_x, value_id_y)
+                self.itemconfigure(value_id, text='0')
+                self.coords(hole_id, hole_def['x'], hole_def['y'])
+                self.itemconfigure(hole_id, image=hole_def['deselect_image'])
 
             self.set_hole_vars(hole_id, value_id, hole, hole_def)
-            self.set_hole_bindings(hole_id)
 
     def set_hole_vars(self, hole_id, value_id, hole, hole_def):
         self.hole_name_to_id[hole] = hole_id
@@ -310,3 +350,73 @@ class BoardView(Canvas):
             return 'L'
         else:
             return None
+
+
+class MoveAnimator(object):
+    '''Plays moves back on a BoardView one sow step at a time.
+
+    Steps are shown by after() callbacks in Tk's thread, step_time
+    milliseconds apart (0 shows the end of every move at once). A move
+    can be skipped to its end and fast_forward speeds playback up by
+    FAST_FORWARD times.
+    '''
+    FAST_FORWARD = 8
+
+    def __init__(self, board_view, step_time=250):
+        self.board_view = board_view
+        self.step_time = step_time
+        self.fast_forward = False
+        self._move = None       # (steps, board, callback) being played
+        self._step = 0
+        self._after_id = None
+
+    def play(self, steps, board, callback=None):
+        '''Show steps, the (hole, value) updates made by a move, ending on
+        board. callback is called once the move has been shown.'''
+        self.skip()
+        self._move = (steps, board, callback)
+        self._step = 0
+        self._show_step()
+
+    def is_playing(self):
+        return self._move is not None
+
+    def skip(self):
+        '''Show the end of the move being played right away.'''
+        if self._after_id is not None:
+            self.board_view.after_cancel(self._after_id)
+            self._after_id = None
+        if self._move is not None:
+            self._finish()
+
+    def set_step_time(self, step_time):
+        self.step_time = step_time
+
+    def set_fast_forward(self, fast_forward):
+        self.fast_forward = fast_forward
+
+# private:
+    def _show_step(self):
+        self._after_id = None
+        steps = self._move[0]
+        step_time = self.step_time
+        if self.fast_forward:
+            step_time //= self.FAST_FORWARD
+        if self._step >= len(steps) or step_time <= 0:
+            self._finish()
+            return None
+        hole, value = steps[self._step]
+        self._step += 1
+        self.board_view.clear_all_holes()
+        self.board_view.highlight_hole(hole)
+        self.board_view.update_hole(hole, value)
+        self._after_id = self.board_view.after(step_time, self._show_step)
+
+    def _finish(self):
+        steps, board, callback = self._move
+        self._move = None
+        self.board_view.clear_all_holes()
+        if self._step < len(steps):
+            self.board_view.update(board)
+        if callback:
+            callback()
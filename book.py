@@ -0,0 +1,201 @@
+#!/usr/bin/python
+'''Opening books for Malume.
+
+A book maps positions (State.get_hash()) reached from a variant's start
+position to the move Malume found best there. Books are built offline (see
+build or run this module) and kept in BOOK_DIR_PATH, one per variant, as
+fixed size records sorted by key:
+
+    header: MAGIC, number of records (uint32)
+    record: key (uint64), move (uint8, see encode_move), depth (uint8),
+            score (int16)
+
+Books are memory mapped and binary searched in place, opening one costs
+next to nothing.
+'''
+import argparse
+import mmap
+import os
+import os.path
+import struct
+import sys
+import time
+
+import bao
+
+BOOK_DIR_PATH = 'books'
+
+MAGIC = b'BAOBOOK1'
+HEADER = struct.Struct('<8sI')
+RECORD = struct.Struct('<QBBh')
+
+MODIFIERS = ('', '>', '$')
+SCORE_LIMIT = 2**15 - 1
+
+
+def encode_move(move):
+    '''Packs move into a byte: hole index, direction and modifier.
+
+    Takasa moves ('$') are the only ones without a direction ('-'), the
+    modifier stands for it.
+    '''
+    hole, direction, mod = bao.Move.split_move(move)
+    if (direction == '-') != (mod == '$'):
+        raise ValueError('Invalid move {}'.format(move))
+    return (bao.Board.hole_index(hole)
+            | (direction == 'R') << 5
+            | MODIFIERS.index(mod) << 6)
+
+
+def decode_move(code):
+    '''Reverses encode_move.'''
+    mod = MODIFIERS[code >> 6]
+    if mod == '$':
+        direction = '-'
+    else:
+        direction = 'R' if code & 32 else 'L'
+    return bao.HOLES[code & 31] + direction + mod
+
+
+def get_book_path(variant):
+    return os.path.join(BOOK_DIR_PATH, variant + '.book')
+
+
+class Book(object):
+    '''A read only, memory mapped opening book.'''
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+            magic, self.size = HEADER.unpack_from(self._map, 0)
+            if (magic != MAGIC
+                    or len(self._map) != HEADER.size + self.size * RECORD.size):
+                raise ValueError('Invalid book file {}'.format(path))
+        except:
+            self.close()
+            raise
+
+    def close(self):
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __len__(self):
+        return self.size
+
+    def probe(self, key):
+        '''Returns (move, depth, score) stored for key or None.'''
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record = RECORD.unpack_from(self._map,
+                                        HEADER.size + mid * RECORD.size)
+            if record[0] < key:
+                lo = mid + 1
+            elif record[0] > key:
+                hi = mid
+            else:
+                return decode_move(record[1]), record[2], record[3]
+        return None
+
+    def lookup(self, state):
+        '''Returns the book move for state or None if state is out of book.'''
+        result = self.probe(state.get_hash())
+        if result is None:
+            return None
+        move = result[0]
+        if move not in state.get_moves() or state.is_long_move(move):
+            return None     # book from different rules?
+        return move
+
+
+def open_book(variant):
+    '''Returns the Book for variant or None if there is none.'''
+    try:
+        return Book(get_book_path(variant))
+    except (IOError, ValueError):
+        return None
+
+
+def write_book(path, entries):
+    '''Write entries, a dict of key -> (move, depth, score), to path.'''
+    with open(path, 'wb') as book_file:
+        book_file.write(HEADER.pack(MAGIC, len(entries)))
+        for key in sorted(entries):
+            move, depth, score = entries[key]
+            score = max(-SCORE_LIMIT, min(SCORE_LIMIT, score))
+            book_file.write(RECORD.pack(key, encode_move(move),
+                                        min(depth, 255), score))
+
+
+def build(variant, plies, settings=None, out=None):
+    '''Searches every position up to plies from variant's start position.
+
+    Returns a dict of key -> (move, depth, score), settings are Malume
+    variables used for the searches (eg move_time).
+    '''
+    import player
+
+    malume = player.Malume()
+    variables = {'verbose': 0, 'ponder': 0, 'book': 0}
+    variables.update(settings or {})
+    for name, value in variables.items():
+        malume.set_var(name, value)
+
+    entries = {}
+    seen = set()
+    frontier = [bao.new_game(variant=variant).get_current_node()[1]]
+    for ply in range(plies):
+        next_frontier = []
+        for state in frontier:
+            key = state.get_hash()
+            if key in seen or state.is_game_over():
+                continue
+            seen.add(key)
+            moves = [m for m in state.get_moves() if not state.is_long_move(m)]
+            if len(moves) > 1:
+                move, score, depth = malume.iterate_best_move(state)
+                if move is not None:
+                    entries[key] = (move, depth, score)
+                    if out:
+                        out.write('{} ply {}: {} (depth {}, score {})\n'
+                                  .format(variant, ply, move, depth, score))
+            next_frontier.extend(state.get_child(m).copy() for m in moves)
+        frontier = next_frontier
+    malume.stop_workers()
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--variant', action='append',
+                        choices=bao.get_variants(),
+                        help='variant to build a book for (default: all)')
+    parser.add_argument('--plies', type=int, default=3,
+                        help='depth of the book in plies')
+    parser.add_argument('--move-time', type=int, default=2000,
+                        help='milliseconds to search each position for')
+    parser.add_argument('--ponder-depth', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=1)
+
+    args = parser.parse_args(sys.argv[1:])
+    settings = {
+        'move_time': args.move_time,
+        'ponder_depth': args.ponder_depth,
+        'workers': args.workers
+    }
+
+    if not os.path.isdir(BOOK_DIR_PATH):
+        os.mkdir(BOOK_DIR_PATH)
+    for variant in args.variant or bao.get_variants():
+        start_time = time.time()
+        entries = build(variant, args.plies, settings, sys.stdout)
+        write_book(get_book_path(variant), entries)
+        print('{}: {} positions in {:.0f} seconds'.format(
+            variant, len(entries), time.time() - start_time))
+
+if __name__ == '__main__':
+    main()
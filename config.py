@@ -4,11 +4,13 @@ import os
 config = configparser.ConfigParser()
 
 config['DEFAULT'] = {
-    'theme': 'default'
+    'theme': 'default',
+    'animation-step-time': 250     # milliseconds per sow step
 }
 
 config['cpu-player'] = {
-    'ponder-depth': 5
+    'ponder-depth': 5,
+    'engine': ''    # engine command line (see engine.py), Malume if empty
 }
 
 config['xmpp'] = {
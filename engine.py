@@ -0,0 +1,233 @@
+#!/usr/bin/python
+'''Runs computer players in processes of their own.
+
+Engines talk a line based protocol on stdin and stdout, in the spirit of
+UCI, built on the BaoAgent operations. Each line is a command followed by
+its arguments:
+
+    newgame FIELD [VARIANT]      start a new game playing on FIELD
+    move MOVE                    the opponent moved
+    forfeit                      the opponent forfeited
+    undo                         undo the last move
+    ack REQUEST STATUS [REASON]  answer to the engine's last request
+    message TEXT                 eg go, stop, vars or set VARIABLE VALUE
+    quit                         stop the engine
+
+Engines answer with move, forfeit, ack and message lines (the engine's
+own requests) and start by sending "id NAME". REQUEST and STATUS are the
+baoAgent RQ_* and STS_* numbers, newlines and backslashes in TEXT and
+REASON are escaped as \\n and \\\\.
+
+    python3 engine.py malume
+
+runs Malume as an engine, EngineAgent plays through an engine process.
+'''
+import argparse
+import os
+import re
+import subprocess
+import sys
+import threading
+
+import baoAgent
+import player
+
+ENGINE_PATH = os.path.abspath(__file__)
+
+
+class EngineError(Exception):
+    pass
+
+
+def escape(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def unescape(text):
+    return re.sub(r'\\(.)',
+                  lambda m: '\n' if m.group(1) == 'n' else m.group(1), text)
+
+
+def _parse_ack(args):
+    # Returns (request, status, reason) of an ack line's arguments
+    argv = args.split(' ', 2)
+    if len(argv) < 2:
+        raise EngineError('Invalid ack: ' + args)
+    reason = unescape(argv[2]) if len(argv) > 2 else None
+    return int(argv[0]), int(argv[1]), reason
+
+
+class EngineDriver(baoAgent.BaoAgent):
+    '''Runs agent for a client on the other end of in_ and out.
+
+    The driver is the agent's arbiter, the agent's requests are written to
+    out as they come (from any thread).
+    '''
+    def __init__(self, agent, in_=sys.stdin, out=sys.stdout):
+        self.agent = agent
+        self.in_ = in_
+        self.out = out
+        self._lock = threading.Lock()
+        agent.set_arbiter(self)
+
+    def run(self):
+        '''Handle the client's commands until quit or end of input.'''
+        self._send('id', self.agent.get_id())
+        for line in iter(self.in_.readline, ''):
+            command, _, args = line.rstrip('\n').partition(' ')
+            if command == 'quit':
+                break
+            try:
+                self._handle(command, args)
+            except (EngineError, ValueError) as e:
+                self.message('Error: {}'.format(e))
+        self.agent.stop_ponder()
+
+    def message(self, msg, from_=None):
+        self._send('message', escape(msg))
+
+    def move(self, mv):
+        self._send('move', mv)
+
+    def forfeit(self):
+        self._send('forfeit')
+
+    def ack(self, request, status, reason=None):
+        if reason:
+            self._send('ack', request, status, escape(reason))
+        else:
+            self._send('ack', request, status)
+
+# private:
+    def _handle(self, command, args):
+        if command == 'newgame':
+            argv = args.split()
+            if not argv:
+                raise EngineError('newgame needs a field')
+            kwargs = {'variant': argv[1]} if len(argv) > 1 else {}
+            self.agent.new_game(argv[0], **kwargs)
+        elif command == 'move':
+            self.agent.move(args)
+        elif command == 'forfeit':
+            self.agent.forfeit()
+        elif command == 'undo':
+            self.agent.undo()
+        elif command == 'ack':
+            self.agent.ack(*_parse_ack(args))
+        elif command == 'message':
+            self.agent.message(unescape(args))
+        else:
+            raise EngineError('Unknown command ({})'.format(command))
+
+    def _send(self, *words):
+        with self._lock:
+            self.out.write(' '.join(str(word) for word in words) + '\n')
+            self.out.flush()
+
+
+class EngineAgent(player.Player):
+    '''Plays through an engine process running command (Malume in
+    engine.py by default).
+
+    Only the variant is passed on to the engine by new_game. The engine's
+    requests reach the arbiter from a thread reading the engine's output,
+    an engine that quits before close forfeits.
+    '''
+    def __init__(self, command=None):
+        player.Player.__init__(self)
+        if command is None:
+            command = [sys.executable, ENGINE_PATH, 'malume']
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        universal_newlines=True, bufsize=1)
+        response, _, name = self.process.stdout.readline().partition(' ')
+        if response != 'id':
+            self.process.kill()
+            raise EngineError('Not an engine: ' + ' '.join(command))
+
+        self.type = player.PL_MACHINE
+        self.id = name.strip()
+
+        self.arbiter = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read)
+        self._reader.daemon = True
+        self._reader.start()
+
+    def set_arbiter(self, arbiter):
+        self.arbiter = arbiter
+
+    def new_game(self, field='ab', **kwargs):
+        if 'variant' in kwargs:
+            self._send('newgame', field, kwargs['variant'])
+        else:
+            self._send('newgame', field)
+
+    def message(self, m, from_=None):
+        self._send('message', escape(m))
+
+    def move(self, mv):
+        self._send('move', mv)
+
+    def forfeit(self):
+        self._send('forfeit')
+
+    def undo(self):
+        self._send('undo')
+
+    def ack(self, request, status, reason=None):
+        if reason:
+            self._send('ack', request, status, escape(reason))
+        else:
+            self._send('ack', request, status)
+
+    def stop_ponder(self):
+        self._send('message', 'stop')
+
+    def close(self):
+        '''Stop the engine and wait for it to exit.'''
+        if self._closed:
+            return None
+        self._closed = True
+        try:
+            self._send('quit')
+            self.process.stdin.close()
+        except OSError:
+            pass    # gone already
+        self.process.wait()
+
+# private:
+    def _send(self, *words):
+        with self._lock:
+            self.process.stdin.write(' '.join(str(w) for w in words) + '\n')
+            self.process.stdin.flush()
+
+    def _read(self):
+        for line in iter(self.process.stdout.readline, ''):
+            command, _, args = line.rstrip('\n').partition(' ')
+            if self.arbiter is None:
+                continue
+            if command == 'move':
+                self.arbiter.move(args)
+            elif command == 'forfeit':
+                self.arbiter.forfeit()
+            elif command == 'ack':
+                self.arbiter.ack(*_parse_ack(args))
+            elif command == 'message':
+                self.arbiter.message(unescape(args))
+        if not self._closed and self.arbiter is not None:
+            self.arbiter.message('Engine quit')
+            self.arbiter.forfeit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('engine', nargs='?', default='malume',
+                        choices=sorted(player.ENGINES))
+
+    args = parser.parse_args(sys.argv[1:])
+    EngineDriver(player.ENGINES[args.engine]()).run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/python
+'''Compact binary game records.
+
+A record file holds any number of games one after another, new games are
+appended to the end:
+
+    header: MAGIC
+    game:   variant (uint8, index into bao.get_variants), player starting
+            (uint8, index into PLAYERS), winner (uint8, 0 for none or
+            1 + index into PLAYERS), number of moves (uint16), then the
+            moves, a byte each (see book.encode_move)
+
+Positions are not stored, replay rebuilds them by executing the moves.
+Takata markers ('*' in bao.History) are dropped, they follow from the
+positions.
+'''
+import argparse
+import os
+import struct
+import sys
+import time
+
+import bao
+import book
+
+MAGIC = b'BAOGAME1'
+GAME = struct.Struct('<BBBH')
+
+PLAYERS = ('AB', 'ab')
+MAX_MOVES = 2**16 - 1
+
+
+class RecordError(Exception):
+    pass
+
+
+class GameRecord(object):
+    '''A game: variant, player starting, moves and winner (None if the
+    game was drawn or not finished).'''
+    __slots__ = ('variant', 'player_starting', 'moves', 'winner')
+
+    def __init__(self, variant, player_starting='AB', moves=(), winner=None):
+        self.variant = variant
+        self.player_starting = player_starting
+        self.moves = [move.rstrip('*') for move in moves]
+        self.winner = winner
+
+    def new_game(self):
+        '''Returns a bao.History at the game's start position.'''
+        return bao.new_game(variant=self.variant,
+                            player_starting=self.player_starting)
+
+    def pack(self):
+        if len(self.moves) > MAX_MOVES:
+            raise RecordError('Too many moves: {}'.format(len(self.moves)))
+        winner = 0 if self.winner is None else 1 + PLAYERS.index(self.winner)
+        return (GAME.pack(bao.get_variants().index(self.variant),
+                          PLAYERS.index(self.player_starting), winner,
+                          len(self.moves))
+                + bytes(book.encode_move(move) for move in self.moves))
+
+
+def from_history(history, variant, winner=None):
+    '''Returns the GameRecord of a bao.History of variant.'''
+    moves = [history[i][0] for i in range(1, len(history))]
+    return GameRecord(variant, history[0][1].get_player(), moves, winner)
+
+
+class RecordWriter(object):
+    '''Appends GameRecords to the record file at path.'''
+    def __init__(self, path):
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+
+    def write(self, record):
+        self._file.write(record.pack())
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_records(path):
+    '''Yields the GameRecords in the record file at path.'''
+    variants = bao.get_variants()
+    with open(path, 'rb') as record_file:
+        data = record_file.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise RecordError('Invalid record file {}'.format(path))
+    offset = len(MAGIC)
+    while offset < len(data):
+        if offset + GAME.size > len(data):
+            raise RecordError('Truncated record file {}'.format(path))
+        variant, player, winner, n_moves = GAME.unpack_from(data, offset)
+        offset += GAME.size
+        moves = data[offset:offset + n_moves]
+        if len(moves) != n_moves:
+            raise RecordError('Truncated record file {}'.format(path))
+        offset += n_moves
+        yield GameRecord(variants[variant], PLAYERS[player],
+                         [book.decode_move(code) for code in moves],
+                         PLAYERS[winner - 1] if winner else None)
+
+
+def replay(record):
+    '''Yields (state, move) for every move of record, state being the
+    position the move is made in.
+
+    The same State is yielded every time, moved on in place (see
+    bao.State.make_move), copy it to keep a position.
+    '''
+    state = record.new_game().get_current_node()[1]
+    for move in record.moves:
+        yield state, move
+        try:
+            if state.make_move(move) is None:
+                raise RecordError('Long move {}'.format(move))
+        except bao.InvalidMoveError:
+            raise RecordError('Invalid move {}'.format(move))
+
+
+def replay_file(path):
+    '''Yields (record, state, move) for every move in the record file at
+    path, see replay.'''
+    for record in read_records(path):
+        for state, move in replay(record):
+            yield record, state, move
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('path', help='record file to replay')
+
+    args = parser.parse_args(sys.argv[1:])
+    start_time = time.time()
+    games = plies = 0
+    try:
+        for record in read_records(args.path):
+            games += 1
+            for state, move in replay(record):
+                plies += 1
+    except (RecordError, OSError) as e:
+        parser.exit(1, 'Error: {}\n'.format(e))
+    elapsed = time.time() - start_time
+    print('{} games, {} plies ({} bytes) replayed in {:.2f} seconds, '
+          '{:.0f} plies/s'.format(games, plies,
+                                  os.path.getsize(args.path), elapsed,
+                                  plies / max(elapsed, 1e-6)))
+
+if __name__ == '__main__':
+    main()
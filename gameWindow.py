@@ -2,14 +2,17 @@ from tkinter import *
 from tkinter.ttk import *
 
 import os
-import threading
-import time
+import queue
+import shlex
 import tkinter.messagebox
 
+import arbiter
 import bao
 import baoAgent
 import boardView 
 import chatArea
+import config
+import engine
 import historyView
 import player
 import theme
@@ -17,55 +20,38 @@ import theme
 
 USERNAME = os.environ.get('USERNAME') or os.environ.get('USER')
 
+# Milliseconds between checks for arbiter events
+EVENT_POLL_TIME = 50
+
+# Milliseconds per sow step of animated moves
+ANIMATION_SPEEDS = (('Slow', 500), ('Normal', 250), ('Fast', 100),
+                    ('No animation', 0))
+
+
+def new_machine_player():
+    '''Returns a computer player, playing through the configured engine
+    process if there is one.'''
+    command = config.get_config()['cpu-player'].get('engine')
+    if command:
+        return engine.EngineAgent(shlex.split(command))
+    return player.Malume()
+
 
 class GameWindow(Toplevel):
-    class ArbiterProxy(baoAgent.BaoAgent):
-        def __init__(self, parent, target):
-            '''parent is the GameWindow and target is the field of player
-            communicating through this proxy.'''
-            super(type(self), self).__init__()
-            self.parent = parent
-            self.player_fd = target
-            self.opponent_fd = bao.Board.rival_field(target)
-
-        def new_game(self, field, **kwargs):
-            pass
-
-        def message(self, msg):
-            self.parent.players[self.opponent_fd].message(msg, self.opponent_fd)
-            self.parent.chat_area.message(msg, self.player_fd)
-
-        def move(self, mv):
-            self.parent.move(mv, self.player_fd, self.opponent_fd)
-
-        def forfeit(self):
-            self.parent.forfeit(self.player_fd)
-
-        def ack(self, request, status, reason=None):
-            if request == baoAgent.RQ_UNDO and self.parent.pending_undo != 0:
-                self.parent.pending_undo -= 1
-                if status == baoAgent.STS_ACCEPT:
-                    self.parent.game.pop_node()
-                    board = self.parent.game.get_current_node()[1].get_board()
-                    self.parent.board_view.update(board)
-            elif request == baoAgent.RQ_MOVE:
-                if status == baoAgent.STS_REJECT:
-                    self.parent.board.set_notification(
-                        'Player rejected move: ' + (reason or ''),
-                        boardView.NOTIFICATION_ERROR)
-                    
-           
     def __init__(self, ab_color='red', AB_color='blue'):
         Toplevel.__init__(self)
         self.styler = Style()
 
-        self.exec_move_thread = None
-        self.exec_move_sem = threading.Semaphore()
-
-        self.pending_undo = 0
+        self.arbiter = None
+        # Arbiter events wait here for Tk's thread (see pump_events)
+        self._events = queue.Queue()
+        self._sow_steps = []
 
         self.board_view = boardView.BoardView(self, relief=FLAT)
         self.board_view.grid(row=0, column=0, columnspan=2)
+        step_time = config.get_config()['DEFAULT'].getint(
+            'animation-step-time', 250)
+        self.animator = boardView.MoveAnimator(self.board_view, step_time)
 
         self.history_view = historyView.HistoryView(self,
                                                     ab_color=ab_color,
@@ -108,15 +94,49 @@ class GameWindow(Toplevel):
         self.bind('<Control-KeyPress-i>', lambda e: self.board_view.invert())
         self.menu.add_cascade(label='Edit', menu=edit_menu)
 
+        view_menu = Menu(self.menu, relief=FLAT, tearoff=False)
+        self.animation_speed_var = IntVar(self, step_time)
+        speed_menu = Menu(view_menu, relief=FLAT, tearoff=False)
+        for label, speed in ANIMATION_SPEEDS:
+            speed_menu.add_radiobutton(
+                label=label, value=speed, variable=self.animation_speed_var,
+                command=lambda : self.animator.set_step_time(
+                    self.animation_speed_var.get()))
+        view_menu.add_cascade(label='Animation speed', menu=speed_menu)
+        view_menu.add_command(label='Skip move',
+                              accelerator='Escape',
+                              command=self.animator.skip)
+        self.bind('<KeyPress-Escape>', lambda e: self.animator.skip())
+        self.fast_forward_var = BooleanVar(self, False)
+        view_menu.add_checkbutton(
+            label='Fast forward',
+            accelerator='Ctrl+F',
+            variable=self.fast_forward_var,
+            command=lambda : self.animator.set_fast_forward(
+                self.fast_forward_var.get()))
+        self.bind('<Control-KeyPress-f>', lambda e: self.toggle_fast_forward())
+        self.menu.add_cascade(label='View', menu=view_menu)
+
+        self._pump_id = self.after(EVENT_POLL_TIME, self.pump_events)
+
     def new_game(self, variant, AB_player, ab_player):
-        self.game = bao.new_game(variant=variant)
+        self.arbiter = arbiter.Arbiter(variant=variant)
+        self.game = self.arbiter.game
         self.players = {'AB': AB_player, 'ab': ab_player}
+        # Moves are executed at once by the arbiter and shown afterwards
+        self.arbiter.subscribe('sow', self.move_watcher)
+        self.arbiter.subscribe('move_done', self.queue_move_done)
+        for event, listener in (('move_started', self.on_move_started),
+                                ('move_rejected', self.on_move_rejected),
+                                ('ack', self.on_ack),
+                                ('message', self.on_message),
+                                ('undo', self.on_undo),
+                                ('game_over', self.on_game_over)):
+            self.arbiter.subscribe(event, self.queue_event(listener))
         if AB_player.get_type() == player.PL_MACHINE:
-            AB_player.set_arbiter(self.ArbiterProxy(self, 'AB'))
             self.chat_area.set_event_listener('message_AB', AB_player.message)
             self.chat_area.set_id('AB', AB_player.get_id())
         if ab_player.get_type() == player.PL_MACHINE:
-            ab_player.set_arbiter(self.ArbiterProxy(self, 'ab'))
             self.chat_area.set_event_listener('message_ab', ab_player.message)
             self.chat_area.set_id('ab', ab_player.get_id())
         
@@ -129,97 +149,115 @@ class GameWindow(Toplevel):
         if p.get_type() == player.PL_MACHINE:
             self.board_view.set_move_polling(False)
         self.board_view.set_move_listener(self.board_view_move)
-        ab_player.message('go')
-        AB_player.message('go')
+        self.arbiter.start()
+        self.arbiter.new_game(AB_player, ab_player)
 
     def main(self):
         self.mainloop()
 
+    def destroy(self):
+        self.after_cancel(self._pump_id)
+        self.animator.skip()
+        if getattr(self, 'arbiter', None):
+            self.arbiter.stop(wait=False)
+            for agent in self.arbiter.players.values():
+                if isinstance(agent, engine.EngineAgent):
+                    agent.close()
+        Toplevel.destroy(self)
+
     def quit(self, exit_sts=0):
         self.destroy()
         exit(exit_sts)
 
+    def pump_events(self):
+        '''Handle the arbiter's events in Tk's thread, holding them back
+        while a move is being shown.'''
+        while not self.animator.is_playing():
+            try:
+                listener, args = self._events.get_nowait()
+            except queue.Empty:
+                break
+            listener(*args)
+        self._pump_id = self.after(EVENT_POLL_TIME, self.pump_events)
+
+    def queue_event(self, listener):
+        # Returns an arbiter listener passing events on to listener in
+        # Tk's thread
+        return lambda *args: self._events.put((listener, args))
+
     def move_watcher(self, hole, value):
-        self.board_view.clear_all_holes()
-        self.board_view.highlight_hole(hole)
-        self.board_view.update_hole(hole, value)
-        time.sleep(0.25)
+        # Arbiter's thread, the move is shown once it is done
+        self._sow_steps.append((hole, value))
         return True
 
+    def queue_move_done(self, player_fd, move):
+        # Arbiter's thread, the board is taken now as the game moves on
+        steps, self._sow_steps = self._sow_steps, []
+        board = self.game.get_current_node()[1].get_board()
+        self._events.put((self.on_move_done, (player_fd, move, steps, board)))
+
+    def toggle_fast_forward(self):
+        self.fast_forward_var.set(not self.fast_forward_var.get())
+        self.animator.set_fast_forward(self.fast_forward_var.get())
+
     def board_view_move(self, mv):
-        player_fd = self.game.get_player()
-        opponent_fd = bao.Board.rival_field(player_fd)
-        self.move(mv, player_fd, opponent_fd)
-                                         
-    def move(self, mv, player_fd, opponent_fd):
-        self.exec_move_sem.acquire()
         self.board_view.set_move_polling(False)
-        mv_t = self.game.get_closest_move(mv)
-        p = self.players[player_fd]
-        if self.game.get_player() != player_fd:
-            p.ack(baoAgent.RQ_MOVE, baoAgent.STS_REJECT, 'Not your turn yet')
-            self.board_view.set_notification(
-                'Move rejected, not {}\'s turn'.format(player_fd),
-                boardView.NOTIFICATION_ERROR)
-            self.exec_move_sem.release()
-            if p.get_type() == player.PL_HUMAN:
-                self.board_view.set_move_polling(True)
-        elif mv_t is None:
-            p.ack(baoAgent.RQ_MOVE, baoAgent.STS_REJECT, 'Invalid move')
-            self.board_view.set_notification(
-                'Invalid move ({}) by {}'.format(mv, p.get_id()),
-                boardView.NOTIFICATION_ERROR)
-            self.exec_move_sem.release()
-            if p.get_type() == player.PL_HUMAN:
-                self.board_view.set_move_polling(True)
-        else:
-            if self.exec_move_thread:
-                self.exec_move_thread.join()
-            self.exec_move_thread = threading.Thread(
-                target=self.exec_move, args=(mv_t,))
-            self.exec_move_thread.start()
+        self.arbiter.move(mv, self.game.get_player())
 
-    def exec_move(self, move):
+    def request_undo(self):
+        return None         # FIX-ME: Add a delete method to HistoryView
+        self.arbiter.request_undo()
+
+# Arbiter events:
+    def on_move_started(self, player_fd, move):
+        self.board_view.set_move_polling(False)
         self.board_view.set_notification('Executing {}'.format(move))
-        player_fd = self.game.get_player()
-        opponent_fd = bao.Board.rival_field(player_fd)
-        try:
-            self.players[opponent_fd].move(move)
-            self.game.branch(move, True, move_watcher=self.move_watcher)
-            self.board_view.clear_all_holes()
-        except bao.InvalidMoveError:
-            self.board_view.set_notification(
-                'Move {} rejected - Invalid move'.format(move),
-                boardView.NOTIFICATION_ERROR)
-        except bao.LongMoveError:
+
+    def on_move_done(self, player_fd, move, steps, board):
+        self.animator.play(steps, board, self.on_move_shown)
+
+    def on_move_shown(self):
+        if (not self.arbiter.game_over and
+                self.players[self.game.get_player()].get_type()
+                    == player.PL_HUMAN):
+            self.board_view.set_move_polling(True)
+
+    def on_move_rejected(self, player_fd, move, reason):
+        p = self.players[player_fd]
+        if reason == 'Not your turn yet':
+            notification = 'Move rejected, not {}\'s turn'.format(player_fd)
+        else:
+            notification = 'Move {} by {} rejected - {}'.format(
+                move, p.get_id(), reason)
+        self.board_view.set_notification(notification,
+                                         boardView.NOTIFICATION_ERROR)
+        if p.get_type() == player.PL_HUMAN:
+            self.board_view.set_move_polling(True)
+
+    def on_ack(self, player_fd, request, status, reason):
+        if request == baoAgent.RQ_MOVE and status == baoAgent.STS_REJECT:
             self.board_view.set_notification(
-                'Move {} rejected - Long move'.format(move),
+                'Player rejected move: ' + (reason or ''),
                 boardView.NOTIFICATION_ERROR)
-        finally:
-            player_fd = self.game.get_player()
-            opponent_fd = bao.Board.rival_field(player_fd)
-            if self.game.is_game_over():
-                opp = self.players[opponent_fd]
-                self.board_view.set_notification(opp.get_id() + ' wins.')
-            elif self.players[player_fd].get_type() == player.PL_HUMAN:
-                self.board_view.set_move_polling(True)
-            self.exec_move_sem.release()
-
-    def forfeit(self, player_fd):
-        def report_forfeit(winner_fd, loser_fd):
-            loser = self.players[loser_fd]
-            winner = self.players[winner_fd]
+
+    def on_message(self, player_fd, msg):
+        self.chat_area.message(msg, player_fd)
+
+    def on_undo(self, node):
+        board = self.game.get_current_node()[1].get_board()
+        self.board_view.update(board)
+
+    def on_game_over(self, winner_fd, reason):
+        loser_fd = bao.Board.rival_field(winner_fd)
+        winner = self.players[winner_fd]
+        loser = self.players[loser_fd]
+        self.board_view.set_move_polling(False)
+        if reason == 'forfeit':
             self.board_view.set_notification(
                 '{} playing as {} wins. {} playing as {} has forfeited.'.format(
                     winner.get_id(), winner_fd, loser.get_id(), loser_fd))
-        report_forfeit(bao.Board.rival_field(player_fd), player_fd)
-
-    def request_undo(self):
-        return None         # FIX-ME: Add a delete method to HistoryView
-        for p in list(self.players.values()):
-            if p.get_type() != player.PL_HUMAN:
-                p.undo()
-            self.pending_undo += 1
+        else:
+            self.board_view.set_notification(winner.get_id() + ' wins.')
 
 
 class NewLocalGameWindow(Toplevel):
@@ -303,7 +341,7 @@ class NewLocalGameWindow(Toplevel):
                 return None
             AB_player.set_id(AB_id)
         elif AB_player_type == player.PL_MACHINE:
-            AB_player = player.Malume()
+            AB_player = new_machine_player()
             AB_player.new_game('AB', variant=variant)
 
         ab_player_type = self.ab_player_var.get()
@@ -317,7 +355,7 @@ class NewLocalGameWindow(Toplevel):
                 return None
             ab_player.set_id(ab_id)
         elif ab_player_type == player.PL_MACHINE:
-            ab_player = player.Malume()
+            ab_player = new_machine_player()
             ab_player.new_game(field='ab', variant=variant)
 
         game_window = GameWindow()
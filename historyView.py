@@ -1,23 +1,54 @@
 from tkinter import *
 from tkinter.ttk import *
 
+import tkinter.font
+
+# Milliseconds between checks for new moves
+HISTORY_POLL_TIME = 100
+# Milliseconds the mouse has to rest on an entry before the board shows it
+PREVIEW_DELAY = 60
+
+
 class HistoryView(LabelFrame):
-    def __init__(self, master, ab_color, AB_color, *args, **kwargs):
+    '''Lists the moves of a game, hovering over a move shows its position
+    on the board view.
+
+    Only the visible rows are drawn, as canvas text items reused while
+    scrolling, so the cost of a move or a scroll does not grow with the
+    length of the game. The history is only read in Tk's thread, its
+    watcher just flags changes.
+    '''
+    def __init__(self, master, ab_color, AB_color, rows=10, *args, **kwargs):
         LabelFrame.__init__(self, master, text='History', labelanchor=N,
                             *args, **kwargs)
 
-        self.text = Text(self, takefocus=0, width=20, height=10,
-                         background='white', font='sans-serif 10')
-        self.text.bind('<FocusIn>', lambda e: self.master.focus_set())
-        self.text.grid(row=0, column=0, sticky=E+W, padx=5, pady=5)
+        self.font = tkinter.font.Font(font='sans-serif 10')
+        self.row_height = self.font.metrics('linespace') + 1
+        self.colors = {'ab': ab_color, 'AB': AB_color}
+
+        self.canvas = Canvas(self, takefocus=0, background='white',
+                             width=self.font.measure('0' * 20),
+                             height=rows * self.row_height,
+                             highlightthickness=0)
+        self.canvas.grid(row=0, column=0, sticky=E+W, padx=5, pady=5)
 
-        self.scrollbar = Scrollbar(self, command=self.text.yview)
-        self.text['yscrollcommand'] = self.scrollbar.set
+        self.scrollbar = Scrollbar(self, command=self.yview)
         self.scrollbar.grid(row=0, column=1, rowspan=2, sticky=N+S, padx=5,
                             pady=5)
 
-        self.text.tag_configure('ab', foreground=ab_color)
-        self.text.tag_configure('AB', foreground=AB_color)
+        self.highlight = self.canvas.create_rectangle(
+            0, 0, 0, 0, fill='Yellow', outline='', state=HIDDEN)
+        self.row_items = [self.canvas.create_text(2, i * self.row_height,
+                                                  anchor=NW, font=self.font)
+                          for i in range(rows)]
+        self.row_texts = [None] * rows
+
+        self.canvas.bind('<Motion>', self.on_mouse_motion)
+        self.canvas.bind('<Leave>', lambda e: self.set_hovered_item(None))
+        self.canvas.bind('<MouseWheel>',
+                         lambda e: self.scroll(-1 if e.delta > 0 else 1))
+        self.canvas.bind('<Button-4>', lambda e: self.scroll(-1))
+        self.canvas.bind('<Button-5>', lambda e: self.scroll(1))
 
         self.on_undo = lambda : None
         self.undo_button = Button(self,
@@ -27,12 +58,18 @@ class HistoryView(LabelFrame):
 
         self.history = None
         self.board_view = None
+        self.top = 0                # item shown on the first row
+        self.follow = True          # keep the last move in view
+        self.hovered_item = None
+        self._changed = False
+        self._preview_id = None
+        self.poll_history()
 
     def set_game(self, game):
         self.history = game
-        for node in self.history:
-            self.on_history_update(node, self.history.branch)
         self.history.add_watcher(self.on_history_update)
+        self.follow = True
+        self.refresh()
 
     def set_board_view(self, board_view):
         self.board_view = board_view
@@ -45,43 +82,108 @@ class HistoryView(LabelFrame):
                 self.on_undo = lambda : None
         else:
             raise ValueError('Unknown event: ' + event)
-    
+
     def write(self, hfile):
-        hfile.write(self.text.get('1.0', END))
+        for item_no in range(len(self.history)):
+            hfile.write(self.get_item_text(item_no) + '\n')
 
-    def on_mouse_enter_item(self, item_no):
-        self.text.tag_config(str(item_no), background='Yellow')
-        move, state = self.history[item_no]
-        self.board_view.update(state.get_board())
+    def get_item_text(self, item_no):
+        return '{:2}. {}'.format(item_no, self.history[item_no][0])
+
+    def refresh(self):
+        '''Redraw the visible rows that changed and the scrollbar.'''
+        n_items = len(self.history) if self.history else 0
+        rows = len(self.row_items)
+        if self.follow:
+            self.top = max(n_items - rows, 0)
+        self.top = max(min(self.top, n_items - rows), 0)
+        for row, item in enumerate(self.row_items):
+            item_no = self.top + row
+            if item_no < n_items:
+                move = self.history[item_no][0]
+                text = self.get_item_text(item_no)
+                color = self.colors.get(move[0] if move else None, 'black')
+            else:
+                text, color = '', 'black'
+            if self.row_texts[row] != (text, color):
+                self.row_texts[row] = (text, color)
+                self.canvas.itemconfigure(item, text=text, fill=color)
+        if n_items:
+            self.scrollbar.set(self.top / n_items,
+                               min(self.top + rows, n_items) / n_items)
+        else:
+            self.scrollbar.set(0, 1)
+        self.show_highlight()
 
-    def on_mouse_leave_item(self, item_no):
-        self.text.tag_config(str(item_no), background='')
-        move, state = self.history.get_current_node()
+    def yview(self, *args):
+        # Scrollbar command
+        if args[0] == 'moveto':
+            n_items = len(self.history) if self.history else 0
+            self.scroll_to(int(float(args[1]) * n_items + 0.5))
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            if args[2] == 'pages':
+                amount *= len(self.row_items)
+            self.scroll(amount)
+
+    def scroll(self, amount):
+        self.scroll_to(self.top + amount)
+
+    def scroll_to(self, top):
+        n_items = len(self.history) if self.history else 0
+        rows = len(self.row_items)
+        self.top = max(min(top, n_items - rows), 0)
+        self.follow = self.top + rows >= n_items
+        self.refresh()
+
+    def show_highlight(self):
+        row = (None if self.hovered_item is None
+               else self.hovered_item - self.top)
+        if row is None or not 0 <= row < len(self.row_items):
+            self.canvas.itemconfigure(self.highlight, state=HIDDEN)
+        else:
+            self.canvas.coords(self.highlight, 0, row * self.row_height,
+                               self.canvas.winfo_width(),
+                               (row + 1) * self.row_height)
+            self.canvas.itemconfigure(self.highlight, state=NORMAL)
+
+    def set_hovered_item(self, item_no):
+        if item_no == self.hovered_item:
+            return None
+        self.hovered_item = item_no
+        self.show_highlight()
+        # Show the position once the mouse rests
+        if self._preview_id is not None:
+            self.after_cancel(self._preview_id)
+        self._preview_id = self.after(PREVIEW_DELAY, self.show_preview)
+
+    def show_preview(self):
+        # BoardView.update only redraws the holes that differ
+        self._preview_id = None
+        if self.board_view is None or self.history is None:
+            return None
+        if self.hovered_item is None:
+            move, state = self.history.get_current_node()
+        else:
+            move, state = self.history[self.hovered_item]
         self.board_view.update(state.get_board())
 
+    def on_mouse_motion(self, event):
+        item_no = self.top + event.y // self.row_height
+        if self.history is None or item_no >= len(self.history):
+            item_no = None
+        self.set_hovered_item(item_no)
+
     def on_history_update(self, node, func_responsible):
-        move, state = node
-        if func_responsible == self.history.branch:
-            item_no = len(self.history) - 1
-            if move is None:
-                tags = (str(item_no),)
-            elif move[0] in 'ab':
-                tags = (str(item_no), 'ab')
-            elif move[0] in 'AB':
-                tags = (str(item_no), 'AB')
-            else:
-                raise ValueError('Invalid move')
-
-            text = self.text
-            text.insert(END, '{:2}. {}\n'.format(item_no, move), tags)
-            text.see(END)
-            text.tag_bind(tags[0], '<Enter>',
-                          lambda e: self.on_mouse_enter_item(item_no),
-                          add='+')
-            text.tag_bind(tags[0], '<Leave>',
-                          lambda e: self.on_mouse_leave_item(item_no),
-                          add='+')
-        elif func_responsible == self.history.pop:
-            item_no = len(self.history) - 1
-            self.text.delete('{}.0'.format(item_no), 'end - 1 chars')
-            self.text.see(END)
+        # May be called from any thread, the view catches up in
+        # poll_history
+        self._changed = True
+
+    def poll_history(self):
+        if self._changed:
+            self._changed = False
+            if (self.hovered_item is not None
+                    and self.hovered_item >= len(self.history)):
+                self.hovered_item = None
+            self.refresh()
+        self.after(HISTORY_POLL_TIME, self.poll_history)
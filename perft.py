@@ -0,0 +1,140 @@
+#!/usr/bin/python
+'''Perft (performance test) for bao.State move generation.
+
+Counts the leaf nodes of the game tree reached through
+State.get_transitions down to a given depth and reports the rate at which
+they were generated. Long moves (transitions without a child) are not
+counted. Every transition is a ply, including those that leave the same
+player to move (eg a nyumba stop).
+
+The counts in GOLDEN_COUNTS were produced by the reference engine. Run
+with --check after touching the move generator or executor to make sure
+the engine still produces exactly the same tree.
+'''
+import argparse
+import sys
+import time
+
+import bao
+
+
+# Leaf counts from the start position of each variant, indexed by depth.
+GOLDEN_COUNTS = {
+    'yawana': (1, 16, 108, 500, 1902, 6550, 23446),
+    'ntchuwa': (1, 16, 160, 1188, 7364, 48764, 299640),
+    'yabambo': (1, 4, 14, 38, 142, 528, 2058, 11302, 65680, 423814),
+}
+
+# Depth to which --check verifies each variant
+CHECK_DEPTHS = {'yawana': 5, 'ntchuwa': 5, 'yabambo': 7}
+
+
+def get_position(variant, moves=()):
+    '''Returns the State reached by playing moves from variant's start
+    position.'''
+    state = bao.new_game(variant=variant).get_current_node()[1]
+    for move in moves:
+        closest_move = state.get_closest_move(move)
+        if closest_move is None:
+            raise bao.InvalidMoveError('Invalid move {}'.format(move))
+        child = state.get_child(closest_move)
+        if child is None:
+            raise bao.LongMoveError('Long move {}'.format(move))
+        state = child.copy()
+    return state
+
+
+def perft(state, depth):
+    '''Returns the number of leaf nodes depth plies below state.'''
+    if depth == 0:
+        return 1
+
+    nodes = 0
+    for move, child in state.get_transitions():
+        if child is None:
+            continue    # long move
+        # Copies drop the child's transition cache, otherwise the whole
+        # tree stays referenced from state until we return.
+        nodes += perft(child.copy(), depth - 1)
+    return nodes
+
+
+def divide(state, depth):
+    '''Returns a list of (move, leaf nodes) for each of state's moves.'''
+    if depth < 1:
+        raise ValueError('Expected depth >= 1, got {}'.format(depth))
+    return [(move, perft(child.copy(), depth - 1))
+            for move, child in sorted(state.get_transitions())
+            if child is not None]
+
+
+def run(state, depth):
+    '''Runs perft on state, returns (nodes, seconds taken).'''
+    start_time = time.time()
+    nodes = perft(state, depth)
+    return nodes, time.time() - start_time
+
+
+def check(variants=None, out=sys.stdout):
+    '''Compare perft results against GOLDEN_COUNTS, returns True if all
+    counts match.'''
+    passed = True
+    for variant in variants or bao.get_variants():
+        for depth in range(1, CHECK_DEPTHS[variant] + 1):
+            nodes, seconds = run(get_position(variant), depth)
+            expected = GOLDEN_COUNTS[variant][depth]
+            status = 'ok' if nodes == expected else 'FAILED'
+            out.write('{} depth {}: {} nodes (expected {}) {}, {} nodes/s\n'
+                      .format(variant, depth, nodes, expected, status,
+                              format_rate(nodes, seconds)))
+            passed = passed and nodes == expected
+    return passed
+
+
+def format_rate(nodes, seconds):
+    if seconds <= 0:
+        return 'n/a'
+    return '{:.0f}'.format(nodes / seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--variant', default='ntchuwa',
+                        choices=bao.get_variants())
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--moves', default='',
+                        help='comma separated moves leading to the position')
+    parser.add_argument('--divide', action='store_true',
+                        help='report leaf nodes per root move')
+    parser.add_argument('--check', action='store_true',
+                        help='verify results against the golden counts')
+
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.check:
+        exit(0 if check() else 1)
+
+    moves = [m.strip() for m in args.moves.split(',') if m.strip()]
+    state = get_position(args.variant, moves)
+
+    start_time = time.time()
+    if args.divide:
+        results = divide(state, args.depth)
+        for move, nodes in results:
+            print('{}: {}'.format(move, nodes))
+        nodes = sum(n for _, n in results)
+    else:
+        nodes = perft(state, args.depth)
+    seconds = time.time() - start_time
+
+    print('{} depth {}: {} nodes in {:.3f} seconds ({} nodes/s)'.format(
+        args.variant, args.depth, nodes, seconds, format_rate(nodes, seconds)))
+
+    if not moves and args.depth < len(GOLDEN_COUNTS[args.variant]):
+        if nodes != GOLDEN_COUNTS[args.variant][args.depth]:
+            print('Mismatch: expected {} nodes'.format(
+                GOLDEN_COUNTS[args.variant][args.depth]))
+            exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,7 @@
+import asyncio
+import concurrent.futures
+import math
+import multiprocessing
 import random
 import threading
 import sys
@@ -5,15 +9,104 @@ import time
 
 import bao
 import baoAgent
+import book
+import tablebase
+
+try:
+    import batch_eval
+except ImportError:     # NumPy is optional
+    batch_eval = None
 
 MAX_INT = sys.maxsize
 MIN_INT = -(MAX_INT - 1)
+# Scores beyond PROVEN_SCORE are won (or lost) positions: a win in n plies
+# from the root scores MAX_INT - 1 - n, a loss MIN_INT + n (see
+# Malume.get_tablebase_score)
+PROVEN_SCORE = MAX_INT - 1 - 2**15
 
 # Player types:
 PL_HUMAN   = 0
 PL_MACHINE = 1
 
 
+class SearchAborted(Exception):
+    '''Raised by Malume.get_best_move once the search budget is used up.'''
+    pass
+
+
+# Move ordering priorities (see Malume.order_moves), history scores stay
+# well below ORDER_KILLER.
+ORDER_PV      = 1 << 62
+ORDER_CAPTURE = 1 << 61
+ORDER_KILLER  = 1 << 60
+N_KILLERS     = 2
+
+# Transposition table bound types:
+TT_EXACT = 0
+TT_LOWER = 1    # score is a lower bound (search failed high)
+TT_UPPER = 2    # score is an upper bound (search failed low)
+
+
+class TranspositionTable(object):
+    '''Fixed size table of search results keyed by State.get_hash().
+
+    Entries are (key, depth, bound, score, move, generation) tuples kept in
+    slot key % size. An entry is replaced by results for the same position,
+    results of a later search (generation) or results of an equal or deeper
+    search.
+
+    Won and lost scores count plies from the search root, the table keeps
+    them counting from the position stored so that they hold wherever the
+    position is met again. store and probe take the position's ply for the
+    conversion.
+    '''
+    # Approximate memory taken by a slot and its entry (in bytes)
+    ENTRY_SIZE = 192
+
+    def __init__(self, size_mb=16):
+        self.resize(size_mb)
+
+    def resize(self, size_mb):
+        '''Reallocate table to fit in size_mb megabytes, 0 disables it.'''
+        self.size = max(0, size_mb) * 2**20 // self.ENTRY_SIZE
+        self.clear()
+
+    def clear(self):
+        self.slots = [None] * self.size
+        self.generation = 0
+
+    def new_search(self):
+        self.generation += 1
+
+    def probe(self, key, ply=0):
+        if not self.size:
+            return None
+        entry = self.slots[key % self.size]
+        if entry is not None and entry[0] == key:
+            score = entry[3]
+            if score >= PROVEN_SCORE:
+                return entry[:3] + (score - ply,) + entry[4:]
+            elif score <= -PROVEN_SCORE:
+                return entry[:3] + (score + ply,) + entry[4:]
+            return entry
+        return None
+
+    def store(self, key, depth, bound, score, move, ply=0):
+        if not self.size:
+            return None
+        if score >= PROVEN_SCORE:
+            score += ply
+        elif score <= -PROVEN_SCORE:
+            score -= ply
+        slot = key % self.size
+        entry = self.slots[slot]
+        if (entry is None
+                or entry[0] == key
+                or entry[5] != self.generation
+                or depth >= entry[1]):
+            self.slots[slot] = (key, depth, bound, score, move, self.generation)
+
+
 class Player(baoAgent.BaoAgent):
     def __init__(self):
         self.id = 'Player'
@@ -36,32 +129,45 @@ class Player(baoAgent.BaoAgent):
         pass
 
 
-class Malume(Player):
+def split_command(m):
+    '''Returns (command, arguments) of message m.'''
+    vcmd = m.split(None, 1)
+    if len(vcmd) > 1:
+        return vcmd[0], vcmd[1].strip().split()
+    elif vcmd:
+        return vcmd[0], []
+    else:
+        return '', []
+
+
+class MachinePlayer(Player):
+    '''Base of the computer players.
+
+    Moves are searched for in a thread of their own (see ponder), the
+    player answers the set, vars, stop and go messages. Subclasses declare
+    their variables and defaults in VARS, those that can't change while
+    searching in SEARCH_VARS, and implement choose_move.
+    '''
+    VARS = {'verbose': 1}
+    SEARCH_VARS = ()
+
     def __init__(self):
         Player.__init__(self)
         self.game_history = None
+        self.field = None
 
         self.ponder_thread = None
         self._stop_ponder = False
-        self.vars = {
-            'ponder_depth': 6,
-            'stop_ponder': 0,
-            'verbose': 1
-        }
+        self.vars = dict(self.VARS)
 
         self.type = PL_MACHINE
-        self.id = 'Malume'
-
         self.arbiter = None
 
     def set_arbiter(self, arbiter):
         self.arbiter = arbiter
 
     def new_game(self, field='ab', **kwargs):
-        if self.ponder_thread:
-            self._stop_ponder = True
-            self.ponder_thread.join()
-            self.ponder_thread = None
+        self.stop_ponder()
         self.game_history = bao.new_game(**kwargs)
         self.field = field
 
@@ -86,38 +192,27 @@ class Malume(Player):
             self.make_move()
 
     def stop_ponder(self):
+        '''Abort the search, returns True if one was running.'''
         if self.ponder_thread:
             self._stop_ponder = True
+            self._interrupt_search()
             self.ponder_thread.join()
             self.ponder_thread = None
             return True
         else:
             return False
 
+    def is_pondering(self):
+        return bool(self.ponder_thread)
+
     def message(self, m, from_=None):
-        vcmd = m.split(None, 1)
-        if len(vcmd) > 1:
-            cmd = vcmd[0]
-            argv = vcmd[1].strip().split()
-        else:
-            cmd = vcmd[0]
-            argv = []
+        reply = self.var_command(m, self.is_pondering())
+        if reply is not None:
+            self.arbiter.message(reply)
+            return None
 
-        if cmd == 'set':
-            if len(argv) != 2:
-                self.arbiter.message(
-                    'Error: Invalid command ({})\n'.format(m)
-                        +  'do \'set variable flag/value\'')
-                return None
-            if argv[0] in self.vars:
-                if argv[0] == 'ponder_depth' and self.ponder_thread:
-                    self.arbiter.message('Can\'t change that while pondering.')
-                    return None
-                self.vars[argv[0]] = int(argv[1])
-                self.arbiter.message('set ok')
-            else:
-                self.arbiter.message('Error: var ({}) not known'.format(argv[0]))
-        elif cmd == 'stop' or cmd == 'hault':
+        cmd, argv = split_command(m)
+        if cmd == 'stop' or cmd == 'hault':
             self.stop_ponder()
             self.arbiter.message('Pondering haulted, will restart on go')
         elif cmd == 'go':
@@ -128,39 +223,70 @@ class Malume(Player):
                 self.arbiter.message('Already pondering...')
             else:
                 self.arbiter.message('Not my turn yet')
+        else:
+            self.arbiter.message('Invalid command.')
+
+    def var_command(self, m, pondering):
+        '''Carries out the set or vars command in message m, returns the
+        reply or None if m is some other command.
+
+        SEARCH_VARS are not changed if pondering.
+        '''
+        cmd, argv = split_command(m)
+        if cmd == 'set':
+            if len(argv) != 2:
+                return ('Error: Invalid command ({})\n'.format(m)
+                        + 'do \'set variable flag/value\'')
+            if argv[0] not in self.vars:
+                return 'Error: var ({}) not known'.format(argv[0])
+            if argv[0] in self.SEARCH_VARS and pondering:
+                return 'Can\'t change that while pondering.'
+            self.set_var(argv[0], int(argv[1]))
+            return 'set ok'
         elif cmd == 'vars':
             response = ''
             for key, value in list(self.vars.items()):
                 response += key + ': ' + str(value) + '\n'
-            self.arbiter.message(response)
+            return response
         else:
-            self.arbiter.message('Invalid command.')
-            pass
+            return None
+
+    def set_var(self, name, value):
+        self.vars[name] = value
 
     def forfeit(self):
         self._stop_ponder = True
 
     def undo(self):
-        print("Malume undo!")
+        self.stop_ponder()
         self.game_history.pop_node()
         self.arbiter.ack(baoAgent.RQ_UNDO, baoAgent.STS_ACCEPT, None)
         self.arbiter.message('Undo OK, say \'go\' for me to make my move')
 
+    def choose_move(self, state):
+        '''Returns the move to make in state, None to give up. Runs in the
+        ponder thread, the search stops once _stop_ponder is set.'''
+        raise NotImplementedError()
+
 # private:
     def make_move(self):
         def move_listener(move):
             if move:
                 self.arbiter.message('Moving ' + move)
                 self.game_history.branch(move, exec_move=False)
+                # The reply may arrive (and start the next search) before
+                # arbiter.move returns
+                my_turn = self.game_history.get_player() == self.field
                 self.arbiter.move(move)
-                if self.game_history.get_player() == self.field:
+                if my_turn:
                     self.make_move()
+                else:
+                    self._await_reply()
             else:
                 self.arbiter.message('I give up!')
                 self.arbiter.forfeit()
         self.arbiter.message('Pondering... Please Wait.')
         self.ponder(move_listener)
-        
 
     def ponder(self, callback, threaded=True):
         """Start pondering on next move if possible."""
@@ -169,114 +295,584 @@ class Malume(Player):
                                                   args=(callback, False))
             self.ponder_thread.start()
         else:
-            self.nodes_pondered = 0
             self._stop_ponder = False
             state = self.game_history.get_current_node()[1]
-            start_time = time.time()
-            move, score = self.get_best_move(state,
-                                             state.get_player(),
-                                             self.vars['ponder_depth'])
-            ponder_time = time.time() - start_time
-            if self.vars['verbose']:
-                self.arbiter.message(
-                    'Ponder done: searched {} nodes in {} seconds'.format(
-                        self.nodes_pondered, ponder_time)
-                )
-            callback(move)
-            self.ponder_thread = None
+            callback(self.choose_move(state))
+            if self.ponder_thread is threading.current_thread():
+                self.ponder_thread = None
+
+    def _interrupt_search(self):
+        # Called by stop_ponder once _stop_ponder is set
+        pass
+
+    def _await_reply(self):
+        # Called once the opponent is to move
+        pass
+
+
+class Malume(MachinePlayer):
+    VARS = {
+        'ponder': 1,            # ponder on the opponent's time
+        'book': 1,              # play from the opening book
+        'tablebase': 1,         # probe endgame tablebases
+        'batch_eval': 0,        # evaluate leaves in batches (needs NumPy)
+        'ponder_depth': 32,     # deepest iteration
+        'move_time': 5000,      # milliseconds per move, 0 for no limit
+        'node_limit': 0,        # nodes per move, 0 for no limit
+        'move_ordering': 1,
+        'workers': 1,           # search processes, 1 searches in-process
+        'stop_ponder': 0,
+        'tt_mb': 16,
+        'verbose': 1
+    }
+    SEARCH_VARS = ('ponder_depth', 'tt_mb', 'workers')
+
+    def __init__(self):
+        MachinePlayer.__init__(self)
+        self.background_thread = None   # pondering on the opponent's time
+        self._stop_background = False
+        self._expected_reply = None
+        self._background_lock = threading.RLock()
+        self._background_start = None
+        self._ponder_credit = 0     # seconds pondered on the actual reply
+        self.tt = TranspositionTable(self.vars['tt_mb'])
+        self.book = None
+        self.tablebase = tablebase.open_tablebase()
+        self._probe_tablebase = False
+        self._batch_eval = False
+
+        self.nodes_pondered = 0
+        self.tt_hits = 0
+        self.tb_hits = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.killers = {}       # ply -> moves that recently caused cutoffs
+        self.history = {}       # move -> history heuristic score
+        self._pv_move = None    # best root move of the last iteration
+        self._deadline = None
+        self._node_limit = None
+
+        self._pool = None
+        self._pool_workers = 0
+        self._pool_stop = None
+
+        self.id = 'Malume'
+
+    def new_game(self, field='ab', **kwargs):
+        MachinePlayer.new_game(self, field, **kwargs)
+        if self.book:
+            self.book.close()
+            self.book = None
+        if 'variant' in kwargs and 'rules' not in kwargs:
+            self.book = book.open_book(kwargs['variant'])
+
+    def move(self, mv):
+        with self._background_lock:
+            expected_reply = self._expected_reply
+            if (self.stop_background_ponder()
+                    and expected_reply is not None):
+                state = self.game_history.get_current_node()[1]
+                if state.get_closest_move(mv) == expected_reply:
+                    # Time spent on the expected reply counts towards the
+                    # next search
+                    self._ponder_credit = time.time() - self._background_start
+                    message = 'Ponder hit on ' + expected_reply
+                else:
+                    message = 'Ponder miss, expected ' + expected_reply
+                if self.vars['verbose']:
+                    self.arbiter.message(message)
+        MachinePlayer.move(self, mv)
+        # The opponent may still be to move (eg after stopping in its
+        # nyumba), ponder on from the position actually reached
+        self.start_background_ponder()
+
+    def stop_ponder(self):
+        stopped = MachinePlayer.stop_ponder(self)
+        return self.stop_background_ponder() or stopped
+
+    def is_pondering(self):
+        return bool(self.ponder_thread or self.background_thread)
+
+    def set_var(self, name, value):
+        MachinePlayer.set_var(self, name, value)
+        if name == 'tt_mb':
+            self.tt.resize(value)
+
+    def forfeit(self):
+        MachinePlayer.forfeit(self)
+        self.stop_background_ponder()
+
+    def choose_move(self, state):
+        if self.book and self.vars['book']:
+            move = self.book.lookup(state)
+            if move is not None:
+                self.nodes_pondered = 0
+                if self.vars['verbose']:
+                    self.arbiter.message('Book move ' + move)
+                return move
+        start_time = time.time()
+        move, score, depth = self.iterate_best_move(state)
+        ponder_time = time.time() - start_time
+        if self.vars['verbose']:
+            self.arbiter.message(
+                'Ponder done: depth {} (score {}), {} nodes in {:.2f} '
+                'seconds, {:.0f} nodes/s, {} transposition hits, '
+                '{} tablebase hits, {} cutoffs ({:.0%} on first '
+                'move)'.format(
+                    depth, score, self.nodes_pondered, ponder_time,
+                    self.nodes_pondered / max(ponder_time, 1e-6),
+                    self.tt_hits, self.tb_hits, self.cutoffs,
+                    self.first_move_cutoffs / max(self.cutoffs, 1))
+            )
+        return move
+
+    def start_background_ponder(self):
+        '''Search on the opponent's time.
+
+        The position after the opponent's expected reply (the best move
+        for the opponent found by the last search) is searched until the
+        opponent's move arrives, or the current position if no reply is
+        expected. Results are left in the transposition table for the
+        search that follows the opponent's move.
+        '''
+        with self._background_lock:
+            if (not self.vars['ponder'] or self.background_thread
+                    or self.game_history.get_player() == self.field):
+                return None
+            state = self.game_history.get_current_node()[1]
+            if state.is_game_over():
+                return None
+
+            self._expected_reply = None
+            entry = self.tt.probe(state.get_hash())
+            if entry is not None and entry[4] is not None:
+                child = state.get_child(entry[4])
+                if child is not None and child.get_player() == self.field:
+                    self._expected_reply = entry[4]
+                    state = child.copy()
+
+            self._stop_background = False
+            self._background_start = time.time()
+            self.background_thread = threading.Thread(
+                target=self._ponder_background, args=(state,))
+            self.background_thread.daemon = True
+            self.background_thread.start()
+
+    def stop_background_ponder(self):
+        '''Stop searching on the opponent's time, returns True if a
+        background search was running.'''
+        with self._background_lock:
+            if not self.background_thread:
+                return False
+            self._stop_background = True
+            if self._pool_stop:
+                self._pool_stop.set()
+            self.background_thread.join()
+            self.background_thread = None
+            self._stop_background = False
+            self._expected_reply = None
+            return True
+
+    def _ponder_background(self, state):
+        try:
+            self.iterate_best_move(state, budget=False)
+        except SystemExit:
+            pass
+
+    def _interrupt_search(self):
+        # Pool processes don't see _stop_ponder
+        if self._pool_stop:
+            self._pool_stop.set()
+
+    def _await_reply(self):
+        self.start_background_ponder()
+
+# private:
+    def iterate_best_move(self, state, budget=True):
+        '''Search state with increasing depth until the move_time or
+        node_limit budget is used up or ponder_depth is reached.
+
+        Without a budget the search only stops at ponder_depth or when a
+        background search is stopped.
+
+        Returns (move, score, depth) for the deepest completed iteration.
+        '''
+        self.nodes_pondered = 0
+        self.tt_hits = 0
+        self.tb_hits = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.killers = {}
+        self.history = dict((m, s // 2) for m, s in self.history.items() if s > 1)
+        self._pv_move = None
+        self.tt.new_search()
+        if budget and self.vars['move_time'] > 0:
+            # Pondering on the opponent's reply already did part of the
+            # work, but always leave some time to finish it.
+            move_time = self.vars['move_time'] / 1000.0
+            self._deadline = time.time() + max(move_time - self._ponder_credit,
+                                               move_time / 10)
+        else:
+            self._deadline = None
+        self._node_limit = budget and self.vars['node_limit'] or None
+        self._probe_tablebase = self._tablebase_covers(state)
+        self._batch_eval = self._can_batch_eval()
+        self._ponder_credit = 0
+
+        # Fallback in case not even the first iteration completes
+        best_move, best_score, depth_reached = None, 0, 0
+        for move, child in state.get_transitions():
+            if child is not None:
+                best_move = move
+                break
+
+        try:
+            for depth in range(1, self.vars['ponder_depth'] + 1):
+                try:
+                    if self.vars['workers'] > 1 and len(state.get_moves()) > 1:
+                        move, score = self.get_best_move_parallel(state, depth)
+                    else:
+                        move, score = self.get_best_move(state.copy(),
+                                                         state.get_player(),
+                                                         depth)
+                except SearchAborted:
+                    break
+                best_move, best_score, depth_reached = move, score, depth
+                self._pv_move = move
+                if (len(state.get_moves()) < 2
+                        or abs(score) >= PROVEN_SCORE
+                        or self._out_of_budget()):
+                    break   # deeper iterations won't change anything
+        finally:
+            self._deadline = None
+            self._node_limit = None
+
+        return best_move, best_score, depth_reached
+
+    def get_best_move(self, state, max_player, depth, alpha=MIN_INT, beta=MAX_INT,
+                      ply=0):
+        # Using negamax ponder, scores are relative to the player to move
+        if ply and self._probe_tablebase:
+            value = self.tablebase.probe(state)
+            if value is not None:
+                self.tb_hits += 1
+                return None, self.get_tablebase_score(value, ply)
 
-    def get_best_move(self, state, max_player, depth, alpha=MIN_INT, beta=MAX_INT):
-        # Using negamax ponder
         moves = [m for m in state.get_moves() if m is not None]
         if len(moves) == 1:
-            return moves[0], self.eval_state(state, max_player, depth)
+            return moves[0], self.eval_state(state, state.get_player(), depth,
+                                             ply)
         elif depth == 0 or not moves:
-            return None, self.eval_state(state, max_player, depth)
+            return None, self.eval_state(state, state.get_player(), depth,
+                                         ply)
+
+        if self._out_of_budget():
+            raise SearchAborted()
+
+        key = state.get_hash()
+        entry = self.tt.probe(key, ply)
+        pv_move = self._pv_move if ply == 0 else None
+        if entry is not None:
+            _, tt_depth, bound, score, move, _ = entry
+            if tt_depth >= depth and (bound == TT_EXACT
+                    or bound == TT_LOWER and score >= beta
+                    or bound == TT_UPPER and score <= alpha):
+                self.tt_hits += 1
+                return move, score
+            pv_move = move or pv_move
+
+        if self.vars['move_ordering']:
+            moves = self.order_moves(state, moves, ply, pv_move)
 
         best_moves = []
         best_score = MIN_INT
+        n_searched = 0
+        if depth == 1 and self._batch_eval:
+            leaf_scores = self.eval_children(state, moves, ply)
+        else:
+            leaf_scores = {}
 
         for move in moves:
-            child = state.get_child(move)
-            if child == None:
-                continue    # long move...
             if self._stop_ponder:
                 raise SystemExit()
-            hole, direction, mod = move.split_move(move)
-            if (state.in_namua_phase()
-                and state.is_mtaji()
-                and (hole[1] in '12' and direction == 'L')
-                or (hole[1] in '78' and direction == 'R')):
-                # redundant moves (similar to those going in opposite direction)
+            if self.is_redundant_move(state, move):
                 continue
 
-            if state.get_player() == child.get_player():
-                # score does not change sign if player does not change
-                # (min-max requires sign change), hence search 1 more ply
-                # down to get moves with similar signs only        
-                _, score = self.get_best_move(child.copy(),
-                                              max_player,
-                                              depth,
-                                              -beta,
-                                              -max(alpha, best_score))
+            if move in leaf_scores:
+                score = leaf_scores[move]
             else:
-                _, score = self.get_best_move(child.copy(),
-                                              max_player,
-                                              depth - 1,
-                                              -beta,
-                                              -max(alpha, best_score))
-                score = -score
+                score = self.search_move(state, move, max_player, depth,
+                                         max(alpha, best_score), beta, ply)
+            if score is None:
+                continue    # long move...
             self.nodes_pondered += 1
+            n_searched += 1
 
             if score > best_score:
                 best_score = score
                 best_moves = [move]
 
                 if best_score >= beta:
+                    self.record_cutoff(state, move, depth, ply, n_searched)
                     break
             elif score == best_score:
                 best_moves.append(move)
 
-            # if depth == self.vars['ponder_depth']:
-            #     if self.vars['verbose']:
-            #         self.arbiter.message(
-            #             '{} score {} and current {} scores {}'.format(
-            #                 best_moves, best_score, move, score))
-            if depth == self.vars['ponder_depth']:
-                print(score, move)
-        if depth == self.vars['ponder_depth']:
-            print(best_score, best_moves)
-            print("---------------------------------------------\n")
-
         if best_moves:
+            best_move = random.choice(best_moves)
+        else:
+            # Every move is a long move, the player has lost
+            best_move, best_score = None, MIN_INT + ply
+
+        if best_score <= alpha:
+            bound = TT_UPPER
+        elif best_score >= beta:
+            bound = TT_LOWER
+        else:
+            bound = TT_EXACT
+        self.tt.store(key, depth, bound, best_score, best_move, ply)
+
+        return best_move, best_score
+
+    def get_best_move_parallel(self, state, depth):
+        '''Root parallel variant of get_best_move.
+
+        Each of state's moves is searched to depth by a process of the
+        search pool (see the workers variable) with its own transposition
+        table, the pool persists across moves.
+        '''
+        pool = self._get_pool()
+        self._pool_stop.clear()
+        if self._out_of_budget():
+            raise SearchAborted()   # stopped before the event was cleared
+
+        moves = [m for m in state.get_moves()
+                 if not state.is_long_move(m)
+                    and not self.is_redundant_move(state, m)]
+        if self.vars['move_ordering']:
+            # Most promising moves are queued first
+            moves = self.order_moves(state, moves, 0, self._pv_move)
+        if self._node_limit is not None:
+            node_limit = max(1, (self._node_limit - self.nodes_pondered)
+                                    // max(1, len(moves)))
+        else:
+            node_limit = None
+        settings = dict(self.vars, workers=1)
+
+        futures = [pool.submit(_search_root_move, state, move, depth,
+                               self._deadline, node_limit, settings)
+                   for move in moves]
+        best_moves = []
+        best_score = MIN_INT
+        aborted = False
+        try:
+            for future in futures:
+                move, score, stats = future.result()
+                self.nodes_pondered += stats['nodes'] + 1
+                self.tt_hits += stats['tt_hits']
+                self.tb_hits += stats['tb_hits']
+                self.cutoffs += stats['cutoffs']
+                self.first_move_cutoffs += stats['first_move_cutoffs']
+                if score is None:
+                    aborted = True
+                elif score > best_score:
+                    best_score = score
+                    best_moves = [move]
+                elif score == best_score:
+                    best_moves.append(move)
+        finally:
+            for future in futures:
+                future.cancel()
+
+        if self._stop_ponder:
+            raise SystemExit()
+        elif aborted:
+            raise SearchAborted()
+        elif best_moves:
             return random.choice(best_moves), best_score
         else:
-            return None, 0
+            return None, MIN_INT   # every move is a long move
 
-    def eval_state(self, state, max_player, depth):
-        if state.is_game_over():
-            return MAX_INT if state.get_player() == max_player else 0
-            
-        score = 0.0
-        board = state.get_board()
-
-        for hole in board.holes():
-            v = board[hole]
-            if board.hole_in_field(hole, state.get_player()):   # Hole belongs to current player
-                if hole[0] in 'Aa':
-                    score += 0.5 * v    # Avoid holding large values in front holes
+    def stop_workers(self):
+        '''Shut the search pool down, it is restarted on demand.'''
+        if self._pool:
+            self._pool_stop.set()
+            self._pool.shutdown(wait=True)
+            self._pool = None
+            self._pool_workers = 0
+
+    def _get_pool(self):
+        if self._pool and self._pool_workers != self.vars['workers']:
+            self.stop_workers()
+        if self._pool is None:
+            # Forking a process running Tk and ponder threads is asking for
+            # trouble, workers are spawned instead (once per pool).
+            context = multiprocessing.get_context('spawn')
+            self._pool_stop = context.Event()
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.vars['workers'],
+                mp_context=context,
+                initializer=_init_search_worker,
+                initargs=(self._pool_stop,))
+            self._pool_workers = self.vars['workers']
+        return self._pool
+
+    def search_move(self, state, move, max_player, depth, alpha, beta, ply):
+        '''Returns score of move for state's player or None if move is a long
+        move.
+
+        The move is searched in place, state is restored when done (but not
+        if the search is aborted).
+        '''
+        player = state.get_player()
+        undo = state.make_move(move)
+        if undo is None:
+            return None
+        if state.get_player() == player:
+            # score does not change sign if player does not change, the
+            # player simply moves again at the same depth
+            _, score = self.get_best_move(state, max_player, depth,
+                                          alpha, beta, ply + 1)
+        else:
+            _, score = self.get_best_move(state, max_player, depth - 1,
+                                          -beta, -alpha, ply + 1)
+            score = -score
+        state.unmake_move(undo)
+        return score
+
+    def eval_children(self, state, moves, ply=0):
+        '''Returns a dict of move -> score (as search_move would return at
+        depth 1) for those of moves that end state's player's turn, state
+        being ply plies from the root.
+
+        The children are evaluated together by batch_eval.
+        '''
+        player = state.get_player()
+        scores = {}
+        leaf_moves, rows, players, mtaji = [], [], [], []
+        for move in moves:
+            undo = state.make_move(move)
+            if undo is None:
+                continue    # long move
+            if state.get_player() != player:
+                if state.is_blocked():
+                    scores[move] = -(MIN_INT + ply + 1)
                 else:
-                    score += v
-            elif state.in_namua_phase() and v == 0 and hole[0] in 'Aa':
-                score += 1.5
-            elif state.in_mtaji_phase():
-                if hole[0] in 'Aa':
-                    if v == 0:
-                        score += 2
-                    else:
-                        score += 1
-                elif v < 2:
-                    score += 1
+                    leaf_moves.append(move)
+                    rows.append(bytes(state.board.cells))
+                    players.append(batch_eval.PLAYERS.index(state.player))
+                    mtaji.append(state.is_mtaji())
+            state.unmake_move(undo)
+
+        if leaf_moves:
+            leaf_scores = batch_eval.evaluate(
+                batch_eval.get_cells(rows), players, mtaji,
+                batch_eval.PLAYERS.index(player))
+            scores.update(zip(leaf_moves, leaf_scores.tolist()))
+        return scores
+
+    @staticmethod
+    def get_tablebase_score(value, ply=0):
+        '''Converts a tablebase value of a position ply plies from the root
+        to a search score.'''
+        if value > 0:
+            return MAX_INT - 1 - value - ply    # win in value plies
+        elif value < 0:
+            return MIN_INT - value - 1 + ply    # loss in -value - 1 plies
+        return 0
+
+    @staticmethod
+    def is_redundant_move(state, move):
+        '''Test if move does exactly what another of state's moves does.'''
+        hole, direction, mod = bao.Move.split_move(move)
+        # In namua, captured seeds are sown from the kichwa nearest to a
+        # capturing hole in columns 1, 2, 7 and 8 whatever the direction.
+        return bool(state.in_namua_phase()
+                    and state.is_mtaji()
+                    and ((hole[1] in '12' and direction == 'L')
+                         or (hole[1] in '78' and direction == 'R')))
+
+    def order_moves(self, state, moves, ply, pv_move=None):
+        '''Returns moves sorted most promising first: pv_move, then captures
+        by seeds captured, then killer moves for ply, then by history score.
+        '''
+        killers = self.killers.get(ply, ())
+        is_mtaji = state.is_mtaji()
+        history = self.history
+
+        def priority(move):
+            if move == pv_move:
+                return ORDER_PV
+            elif is_mtaji:
+                return ORDER_CAPTURE + state.get_capture_size(move)
+            elif move in killers:
+                return ORDER_KILLER - killers.index(move)
+            else:
+                return history.get(move, 0)
+
+        return sorted(moves, key=priority, reverse=True)
+
+    def record_cutoff(self, state, move, depth, ply, n_searched):
+        '''Update killer moves, history scores and cutoff statistics after
+        move caused a beta cutoff.'''
+        self.cutoffs += 1
+        if n_searched == 1:
+            self.first_move_cutoffs += 1
+        if state.is_mtaji():
+            return None     # captures are ordered by size already
+        killers = self.killers.setdefault(ply, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[N_KILLERS:]
+        self.history[move] = self.history.get(move, 0) + depth * depth
+
+    def _can_batch_eval(self):
+        # Tablebase probes take precedence over evaluation at the leaves
+        return bool(batch_eval and self.vars['batch_eval']
+                    and not self._probe_tablebase)
+
+    def _tablebase_covers(self, state):
+        # Seeds never leave the board, positions below state can only be in
+        # the tablebase if state has few enough seeds. There is no
+        # tablebase unless one was generated (see tablebase.py).
+        return bool(self.tablebase and self.vars['tablebase']
+                    and sum(state.board.cells) <= self.tablebase.max_seeds)
+
+    def _out_of_budget(self):
+        return (self._stop_background
+                or self._deadline is not None and time.time() >= self._deadline
+                or self._node_limit is not None
+                    and self.nodes_pondered >= self._node_limit)
+
+    def eval_state(self, state, max_player, depth, ply=0):
+        # No move is generated or executed here, the moves the search
+        # generated give the mtaji flag. Positions where every move is a
+        # long move are only found lost once searched (see get_best_move).
+        if state.is_blocked():
+            # Player to move has no legal moves left and has lost
+            if state.get_player() == max_player:
+                return MIN_INT + ply
+            return -(MIN_INT + ply)
+            
+        board = state.board
+        player = state.get_player()
+        opponent = bao.Board.rival_field(player)
+        store = board.cells[bao.FIELD_STORE[player]]
+        opponent_store = board.cells[bao.FIELD_STORE[opponent]]
+        front_seeds, back_seeds, _, _ = board.get_row_features(player)
+        _, _, empty_fronts, weak_backs = board.get_row_features(opponent)
+
+        # Stores are scored as though they were in both rows (A9 and B9), the
+        # player avoids holding large values in front holes.
+        score = 0.5 * front_seeds + back_seeds + 1.5 * store
+        if store:   # namua phase
+            score += 1.5 * (empty_fronts + (opponent_store == 0))
+        else:
+            # 2 per empty opponent front hole and 1 per other, 1 per opponent
+            # back hole holding less than 2 seeds.
+            score += (8 + empty_fronts + weak_backs
+                      + (2 if opponent_store == 0 else 1)
+                      + (opponent_store < 2))
 
         if state.is_mtaji():
             score *= 1.5
@@ -285,3 +881,405 @@ class Malume(Player):
             return int(score)
         else:
             return -int(score)
+
+
+class AsyncMalume(baoAgent.AsyncBaoAgent):
+    '''Malume for asyncio arbiters (see arbiter.AsyncArbiter).
+
+    Searches run in executor (the event loop's default one if None), which
+    must be a thread pool, so that the loop carries on with other games
+    meanwhile. Set the workers var to search in processes instead of
+    sharing the interpreter with the other searches. There is no pondering
+    on the opponent's time, vars are otherwise those of Malume.
+    '''
+    def __init__(self, executor=None):
+        self.engine = Malume()
+        self.engine.vars['ponder'] = 0
+        self.vars = self.engine.vars
+        self.executor = executor
+        self.search_task = None
+        self.field = None
+
+        self.type = PL_MACHINE
+        self.id = 'Malume'
+
+        self.arbiter = None
+
+    def set_arbiter(self, arbiter):
+        self.arbiter = arbiter
+
+    async def new_game(self, field='ab', **kwargs):
+        await self.stop_search()
+        self.engine.new_game(field, **kwargs)
+        self.field = field
+
+    async def move(self, mv):
+        game_history = self.engine.game_history
+        if game_history.get_player() == self.field:
+            await self.arbiter.ack(baoAgent.RQ_MOVE,
+                                   baoAgent.STS_REJECT,
+                                   'Not your turn')
+            return None
+
+        try:
+            game_history.branch(mv)
+            await self.arbiter.ack(baoAgent.RQ_MOVE, baoAgent.STS_ACCEPT, None)
+        except bao.InvalidMoveError:
+            await self.arbiter.ack(baoAgent.RQ_MOVE, baoAgent.STS_REJECT,
+                                   'Invalid move')
+        except bao.LongMoveError:
+            await self.arbiter.ack(baoAgent.RQ_MOVE, baoAgent.STS_REJECT,
+                                   'Invalid move: Long move')
+
+        if game_history.get_player() == self.field:
+            self.start_search()
+
+    async def message(self, m, from_=None):
+        reply = self.engine.var_command(m, bool(self.search_task))
+        if reply is not None:
+            await self.arbiter.message(reply)
+            return None
+
+        cmd, argv = split_command(m)
+        if cmd == 'stop' or cmd == 'hault':
+            await self.stop_search()
+            await self.arbiter.message('Pondering haulted, will restart on go')
+        elif cmd == 'go':
+            if self.search_task:
+                await self.arbiter.message('Already pondering...')
+            elif self.engine.game_history.get_player() == self.field:
+                await self.arbiter.message('Wait for it...')
+                self.start_search()
+            else:
+                await self.arbiter.message('Not my turn yet')
+        else:
+            await self.arbiter.message('Invalid command.')
+
+    async def forfeit(self):
+        await self.stop_search()
+
+    async def undo(self):
+        await self.stop_search()
+        self.engine.game_history.pop_node()
+        await self.arbiter.ack(baoAgent.RQ_UNDO, baoAgent.STS_ACCEPT, None)
+        await self.arbiter.message('Undo OK, say \'go\' for me to make my move')
+
+    def start_search(self):
+        '''Search for a move in a task of its own and make it.'''
+        self.search_task = asyncio.ensure_future(self._make_moves())
+
+    async def stop_search(self):
+        '''Abort the search, returns True if one was running.'''
+        task = self.search_task
+        if task is None:
+            return False
+        self.engine._stop_ponder = True
+        if self.engine._pool_stop:
+            self.engine._pool_stop.set()
+        await task
+        return True
+
+# private:
+    async def _make_moves(self):
+        # Moves until it is the opponent's turn (captures in namua may leave
+        # the turn with us)
+        game_history = self.engine.game_history
+        try:
+            while game_history.get_player() == self.field:
+                state = game_history.get_current_node()[1]
+                move = None
+                if self.engine.book and self.vars['book']:
+                    move = self.engine.book.lookup(state)
+                if move is None:
+                    await self.arbiter.message('Pondering... Please Wait.')
+                    self.engine._stop_ponder = False
+                    start_time = time.time()
+                    move = await asyncio.get_event_loop().run_in_executor(
+                        self.executor, self._search, state)
+                    if self.engine._stop_ponder:
+                        return None
+                    if self.vars['verbose']:
+                        ponder_time = time.time() - start_time
+                        await self.arbiter.message(
+                            'Ponder done: {} nodes in {:.2f} seconds, '
+                            '{:.0f} nodes/s'.format(
+                                self.engine.nodes_pondered, ponder_time,
+                                self.engine.nodes_pondered
+                                    / max(ponder_time, 1e-6)))
+                elif self.vars['verbose']:
+                    await self.arbiter.message('Book move ' + move)
+
+                if not move:
+                    await self.arbiter.message('I give up!')
+                    await self.arbiter.forfeit()
+                    return None
+                await self.arbiter.message('Moving ' + move)
+                game_history.branch(move, exec_move=False)
+                await self.arbiter.move(move)
+        finally:
+            self.search_task = None
+
+    def _search(self, state):
+        # Runs in the executor, SystemExit (the search being stopped) must
+        # not reach the event loop.
+        try:
+            return self.engine.iterate_best_move(state)[0]
+        except SystemExit:
+            return None
+
+
+class _MctsNode(object):
+    '''Node of MonteCarlo's search tree.
+
+    wins counts the playouts through this node won by mover, the player
+    whose move led here. A node's state is dropped once all its moves are
+    expanded.
+    '''
+    __slots__ = ('key', 'state', 'player', 'mover', 'untried', 'children',
+                 'visits', 'wins')
+
+    def __init__(self, state, mover):
+        self.key = state.get_hash()
+        self.state = state
+        self.player = state.get_player()
+        self.mover = mover
+        self.untried = list(state.get_moves())
+        random.shuffle(self.untried)
+        self.children = {}
+        self.visits = 0
+        self.wins = 0.0
+
+    def is_terminal(self):
+        return not self.untried and not self.children
+
+
+class MonteCarlo(MachinePlayer):
+    '''Plays by Monte Carlo tree search (UCT).
+
+    Leaves are scored by playing random games (playouts) to the end,
+    playouts taking longer than playout_plies are won by the player holding
+    more seeds. The tree is kept between moves.
+    '''
+    VARS = {
+        'move_time': 5000,      # milliseconds per move, 0 for no limit
+        'playouts': 0,          # playouts per move, 0 for no limit
+        'exploration': 141,     # UCT exploration constant (x 100)
+        'playout_greed': 50,    # % of playout moves taking the largest capture
+        'playout_plies': 200,
+        'verbose': 1
+    }
+
+    def __init__(self):
+        MachinePlayer.__init__(self)
+        self.root = None
+        self.playouts = 0
+        self.playout_plies = 0
+        self.reused_playouts = 0
+
+        self.id = 'MonteCarlo'
+
+    def new_game(self, field='ab', **kwargs):
+        MachinePlayer.new_game(self, field, **kwargs)
+        self.root = None
+
+    def choose_move(self, state):
+        start_time = time.time()
+        move, visits, win_rate = self.search(state)
+        ponder_time = time.time() - start_time
+        if self.vars['verbose']:
+            self.arbiter.message(
+                'Ponder done: {} playouts ({} reused) in {:.2f} seconds, '
+                '{:.0f} playouts/s, {:.1f} plies per playout, best move '
+                'won {:.0%} of {} playouts'.format(
+                    self.playouts, self.reused_playouts, ponder_time,
+                    self.playouts / max(ponder_time, 1e-6),
+                    self.playout_plies / max(self.playouts, 1),
+                    win_rate, visits)
+            )
+        return move
+
+# private:
+    def search(self, state):
+        '''Grow the tree below state until the move_time or playouts budget
+        is used up.
+
+        Returns (move, visits, win rate) of the most visited move.
+        '''
+        self.root = self._find_root(state)
+        self.reused_playouts = self.root.visits
+        self.playouts = 0
+        self.playout_plies = 0
+        if self.vars['move_time'] > 0:
+            deadline = time.time() + self.vars['move_time'] / 1000.0
+        else:
+            deadline = None
+        playout_limit = self.vars['playouts'] or None
+        exploration = self.vars['exploration'] / 100.0
+
+        while (playout_limit is None or self.playouts < playout_limit) \
+                and (deadline is None or time.time() < deadline):
+            if self._stop_ponder:
+                raise SystemExit()
+            self._grow_tree(exploration)
+            if not self.root.untried and len(self.root.children) < 2:
+                break   # nothing to choose from
+
+        if not self.root.children:
+            return None, 0, 0
+        move, child = max(self.root.children.items(),
+                          key=lambda item: item[1].visits)
+        return move, child.visits, child.wins / max(child.visits, 1)
+
+    def _find_root(self, state):
+        # Reuse the subtree of state if it was reached in the last search
+        # (state is usually the last root's grandchild)
+        key = state.get_hash()
+        if self.root is not None:
+            nodes = [self.root]
+            for _ in range(3):
+                for node in nodes:
+                    if node.key == key and node.player == state.get_player():
+                        return node
+                nodes = [c for n in nodes for c in n.children.values()]
+        return _MctsNode(state.copy(), None)
+
+    def _grow_tree(self, exploration):
+        # Selection
+        node = self.root
+        path = [node]
+        while not node.untried and node.children:
+            node = self._select_child(node, exploration)
+            path.append(node)
+
+        # Expansion
+        while node.untried:
+            move = node.untried.pop()
+            child_state = node.state.get_child(move)
+            if child_state is None:
+                continue    # long move
+            child = _MctsNode(child_state.copy(), node.player)
+            node.children[move] = child
+            if not node.untried:
+                node.state = None   # no longer needed, nor are its children
+            node = child
+            path.append(node)
+            break
+
+        winner = self._playout(node)
+        for node in path:
+            node.visits += 1
+            if winner is None:
+                node.wins += 0.5
+            elif winner == node.mover:
+                node.wins += 1
+        self.playouts += 1
+
+    @staticmethod
+    def _select_child(node, exploration):
+        log_visits = math.log(node.visits)
+        best_child, best_value = None, -1.0
+        for child in node.children.values():
+            value = (child.wins / child.visits
+                     + exploration * math.sqrt(log_visits / child.visits))
+            if value > best_value:
+                best_child, best_value = child, value
+        return best_child
+
+    def _playout(self, node):
+        # Returns the winner of a random game from node, None for a draw
+        if node.is_terminal():
+            return bao.Board.rival_field(node.player)
+
+        state = node.state.copy()
+        greed = self.vars['playout_greed']
+        for _ in range(self.vars['playout_plies']):
+            moves = list(state.get_moves())
+            while moves:
+                if random.randrange(100) < greed and state.is_mtaji():
+                    move = max(moves, key=state.get_capture_size)
+                else:
+                    move = random.choice(moves)
+                if state.make_move(move) is not None:
+                    break
+                moves.remove(move)  # long move
+            else:
+                # Player to move has no legal moves left and has lost
+                return bao.Board.rival_field(state.get_player())
+            self.playout_plies += 1
+
+        seeds = {}
+        for field in ('AB', 'ab'):
+            base = bao.FIELD_BASE[field]
+            seeds[field] = (sum(state.board.cells[base:base + 16])
+                            + state.board.cells[bao.FIELD_STORE[field]])
+        if seeds['AB'] == seeds['ab']:
+            return None
+        return 'AB' if seeds['AB'] > seeds['ab'] else 'ab'
+
+
+# Computer players by name, as engine.py and tournament.py know them
+ENGINES = {
+    'malume': Malume,
+    'montecarlo': MonteCarlo
+}
+
+
+class _WorkerMalume(Malume):
+    '''Malume running searches in a process of Malume's search pool.'''
+    def __init__(self, stop_event):
+        Malume.__init__(self)
+        self.stop_event = stop_event
+
+    def _out_of_budget(self):
+        # Checking the event is relatively costly, do it once in a while
+        if self.nodes_pondered & 0xff == 0 and self.stop_event.is_set():
+            return True
+        return Malume._out_of_budget(self)
+
+
+_worker_malume = None
+
+def _init_search_worker(stop_event):
+    global _worker_malume
+    _worker_malume = _WorkerMalume(stop_event)
+
+
+def _search_root_move(state, move, depth, deadline, node_limit, settings):
+    '''Search move of state in a pool process.
+
+    Returns (move, score, stats), score is None if the search was aborted.
+    '''
+    malume = _worker_malume
+    if malume.vars['tt_mb'] != settings['tt_mb']:
+        malume.tt.resize(settings['tt_mb'])
+    malume.vars.update(settings)
+    malume.nodes_pondered = 0
+    malume.tt_hits = 0
+    malume.tb_hits = 0
+    malume.cutoffs = 0
+    malume.first_move_cutoffs = 0
+    malume._deadline = deadline
+    malume._node_limit = node_limit
+    malume._probe_tablebase = malume._tablebase_covers(state)
+    malume._batch_eval = malume._can_batch_eval()
+    malume.tt.new_search()
+
+    try:
+        score = malume.search_move(state, move, state.get_player(), depth,
+                                   MIN_INT, MAX_INT, 0)
+        if score is None:
+            score = MIN_INT     # long move
+    except SearchAborted:
+        score = None
+    finally:
+        malume._deadline = None
+        malume._node_limit = None
+
+    stats = {
+        'nodes': malume.nodes_pondered,
+        'tt_hits': malume.tt_hits,
+        'tb_hits': malume.tb_hits,
+        'cutoffs': malume.cutoffs,
+        'first_move_cutoffs': malume.first_move_cutoffs
+    }
+    return move, score, stats
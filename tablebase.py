@@ -0,0 +1,267 @@
+#!/usr/bin/python
+'''Endgame tablebases for Malume.
+
+Solves every mtaji position with up to a few seeds on the board by
+retrograde analysis. Positions covered have empty stores and no nyumba
+(neither player owns one). Seeds never leave the board, so positions of
+the standard variants (with 64 or more seeds) are never in the tables, they
+serve games and studies set up with few seeds.
+
+Positions are kept with AB to move, positions with ab to move are looked
+up with the fields swapped (the board is symmetric). For each number of
+seeds the table holds a value per distribution of the seeds over the 32
+holes, ordered as _compositions generates them (see rank). Values are
+int16:
+
+    0       draw (neither player can force a win)
+    d > 0   the player to move wins in d plies
+    d < 0   the player to move loses in -d - 1 plies
+
+The file TABLEBASE_PATH starts with HEADER, the tables for 0, 1, ...
+max_seeds seeds follow one after the other. It is memory mapped, like the
+opening books (see book.py). The file is not distributed, it is generated
+offline by running this module:
+
+    python3 tablebase.py --seeds 5
+
+Without it Malume plays those positions by search alone.
+'''
+import argparse
+import array
+import mmap
+import os
+import os.path
+import struct
+import sys
+import time
+
+import bao
+
+TABLEBASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'tablebases', 'mtaji.tb')
+DEFAULT_SEEDS = 5
+
+MAGIC = b'BAOTB001'
+# magic, max seeds, rules.max_seeds_for_mtaji, rules.long_move_limit
+HEADER = struct.Struct('<8sBBH')
+VALUE = struct.Struct('<h')
+
+N_HOLES = 32
+
+
+def _make_counts(max_seeds):
+    # _COUNTS[h][s] is the number of ways to distribute s seeds over h holes
+    counts = [[1] + [0] * max_seeds]
+    for holes in range(1, N_HOLES + 1):
+        row = []
+        for seeds in range(max_seeds + 1):
+            row.append(sum(counts[holes - 1][k] for k in range(seeds + 1)))
+        counts.append(row)
+    return counts
+
+_MAX_SEEDS = 16
+_COUNTS = _make_counts(_MAX_SEEDS)
+
+
+def get_size(seeds):
+    '''Returns number of positions with seeds seeds on the board.'''
+    return _COUNTS[N_HOLES][seeds]
+
+
+def rank(holes, seeds):
+    '''Returns the position of holes (seed counts for the 32 holes adding up
+    to seeds) in the table for seeds seeds.'''
+    index = 0
+    for i in range(N_HOLES - 1):
+        holes_left = _COUNTS[N_HOLES - 1 - i]
+        for k in range(holes[i]):
+            index += holes_left[seeds - k]
+        seeds -= holes[i]
+        if not seeds:
+            break
+    return index
+
+
+def _compositions(seeds, holes=N_HOLES):
+    # Yields seed distributions in rank order
+    if holes == 1:
+        yield (seeds,)
+        return
+    for first in range(seeds + 1):
+        for rest in _compositions(seeds - first, holes - 1):
+            yield (first,) + rest
+
+
+def _swap_fields(cells):
+    return cells[16:32] + cells[0:16]
+
+
+def get_rules():
+    '''Returns the rules the tables are solved for.'''
+    rules = bao.get_rules('ntchuwa')
+    rules.board_config = {}
+    rules.nyumba_state = {'AB': False, 'ab': False}
+    return rules
+
+
+class Tablebase(object):
+    '''Read only, memory mapped tablebase.'''
+    def __init__(self, path=TABLEBASE_PATH):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+            (magic, self.max_seeds, self.max_seeds_for_mtaji,
+             self.long_move_limit) = HEADER.unpack_from(self._map, 0)
+            self._offsets = [HEADER.size]
+            for seeds in range(self.max_seeds + 1):
+                self._offsets.append(self._offsets[-1]
+                                     + get_size(seeds) * VALUE.size)
+            if magic != MAGIC or len(self._map) != self._offsets[-1]:
+                raise ValueError('Invalid tablebase {}'.format(path))
+        except:
+            self.close()
+            raise
+
+    def close(self):
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def covers(self, state):
+        '''Test if state's rules are those the tables were solved for.'''
+        return (state.rules.max_seeds_for_mtaji == self.max_seeds_for_mtaji
+                and state.rules.long_move_limit == self.long_move_limit)
+
+    def probe(self, state):
+        '''Returns the value of state for the player to move or None if
+        state is not in the tables.'''
+        cells = state.board.cells
+        if (cells[bao.STORE_AB] or cells[bao.STORE_ab]
+                or state.nyumba['AB'] or state.nyumba['ab']
+                or not self.covers(state)):
+            return None
+        if state.player == 'AB':
+            holes = cells[0:N_HOLES]
+        else:
+            holes = _swap_fields(cells)
+        seeds = sum(holes)
+        if seeds > self.max_seeds:
+            return None
+        return VALUE.unpack_from(
+            self._map, self._offsets[seeds] + rank(holes, seeds) * VALUE.size
+        )[0]
+
+
+def open_tablebase(path=TABLEBASE_PATH):
+    '''Returns the Tablebase at path or None if there is none.'''
+    try:
+        return Tablebase(path)
+    except (IOError, ValueError):
+        return None
+
+
+def solve(seeds, rules=None):
+    '''Returns an array of the values of all positions with seeds seeds.'''
+    template = bao.State(rules=rules or get_rules())
+    size = get_size(seeds)
+
+    # Successors of position i are successors[offsets[i]:offsets[i + 1]]
+    offsets = array.array('I', [0])
+    successors = array.array('I')
+    for holes in _compositions(seeds):
+        state = template.copy()
+        for index, count in enumerate(holes):
+            if count:
+                state.board.set_cell(index, count)
+        for move in state.get_moves():
+            undo = state.make_move(move)
+            if undo is None:
+                continue    # long move
+            if state.get_player() != 'ab':
+                raise RuntimeError('Expected ab to move after ' + move)
+            successors.append(rank(_swap_fields(state.board.cells), seeds))
+            state.unmake_move(undo)
+        offsets.append(len(successors))
+
+    # Predecessors of position i are predecessors[pred_offsets[i]:...]
+    pred_offsets = array.array('I', [0]) * (size + 1)
+    for successor in successors:
+        pred_offsets[successor + 1] += 1
+    for i in range(size):
+        pred_offsets[i + 1] += pred_offsets[i]
+    predecessors = array.array('I', [0]) * len(successors)
+    fill = pred_offsets[:size]
+    for position in range(size):
+        for successor in successors[offsets[position]:offsets[position + 1]]:
+            predecessors[fill[successor]] = position
+            fill[successor] += 1
+
+    # Work back from positions without moves (lost), breadth first so that
+    # wins are as short and losses as long as possible.
+    values = array.array('h', [0]) * size
+    moves_left = array.array('I', (offsets[i + 1] - offsets[i]
+                                   for i in range(size)))
+    frontier = [i for i in range(size) if not moves_left[i]]
+    for position in frontier:
+        values[position] = -1
+    distance = 0
+    while frontier:
+        distance += 1
+        next_frontier = []
+        for position in frontier:
+            lost = values[position] < 0
+            for predecessor in predecessors[pred_offsets[position]:
+                                            pred_offsets[position + 1]]:
+                if values[predecessor]:
+                    continue
+                elif lost:
+                    values[predecessor] = distance
+                    next_frontier.append(predecessor)
+                else:
+                    moves_left[predecessor] -= 1
+                    if not moves_left[predecessor]:
+                        values[predecessor] = -distance - 1
+                        next_frontier.append(predecessor)
+        frontier = next_frontier
+    return values
+
+
+def generate(max_seeds, path=TABLEBASE_PATH, out=None):
+    '''Solve positions with up to max_seeds seeds and write them to path.'''
+    rules = get_rules()
+    with open(path, 'wb') as tb_file:
+        tb_file.write(HEADER.pack(MAGIC, max_seeds, rules.max_seeds_for_mtaji,
+                                  rules.long_move_limit))
+        for seeds in range(max_seeds + 1):
+            start_time = time.time()
+            values = solve(seeds, rules)
+            if sys.byteorder != 'little':
+                values.byteswap()
+            values.tofile(tb_file)
+            if out:
+                wins = sum(1 for v in values if v > 0)
+                losses = sum(1 for v in values if v < 0)
+                out.write('{} seeds: {} positions, {} won, {} lost, {} drawn, '
+                          'longest {} plies, {:.0f} seconds\n'.format(
+                              seeds, len(values), wins, losses,
+                              len(values) - wins - losses,
+                              max(v if v > 0 else -v - 1 for v in values),
+                              time.time() - start_time))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--seeds', type=int, default=DEFAULT_SEEDS,
+                        help='solve positions with up to this many seeds')
+    args = parser.parse_args(sys.argv[1:])
+    if not 0 <= args.seeds <= _MAX_SEEDS:
+        parser.error('seeds must be between 0 and {}'.format(_MAX_SEEDS))
+
+    os.makedirs(os.path.dirname(TABLEBASE_PATH), exist_ok=True)
+    generate(args.seeds, out=sys.stdout)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import random
+import unittest
+
+import bao
+import player
+
+try:
+    import batch_eval
+except ImportError:     # NumPy is optional
+    batch_eval = None
+
+
+def random_playouts(variant, n_games=30, max_plies=150, seed=0):
+    '''Yields the positions of random games of variant.'''
+    rng = random.Random(seed)
+    for _ in range(n_games):
+        state = bao.new_game(variant=variant).get_current_node()[1]
+        for _ in range(max_plies):
+            yield state
+            moves = [move for move, child in state.get_transitions()
+                     if child is not None]
+            if not moves:
+                break
+            state = state.get_child(rng.choice(moves))
+
+
+@unittest.skipIf(batch_eval is None, 'NumPy is not installed')
+class BatchEvalTest(unittest.TestCase):
+    def test_matches_eval_state(self):
+        malume = player.Malume()
+        n_states = 0
+        for variant in bao.get_variants():
+            states = [s for s in random_playouts(variant)
+                      if not s.is_game_over()]
+            n_states += len(states)
+            for max_player in batch_eval.PLAYERS:
+                expected = [malume.eval_state(s, max_player, 0)
+                            for s in states]
+                self.assertEqual(
+                    batch_eval.evaluate_states(states, max_player), expected)
+        self.assertTrue(n_states > 1000)
+
+    def test_max_players_array(self):
+        malume = player.Malume()
+        states = [s for s in random_playouts('yawana', n_games=5)
+                  if not s.is_game_over()]
+        rng = random.Random(1)
+        max_players = [rng.randrange(2) for _ in states]
+        cells, players, mtaji = batch_eval.encode(states)
+        scores = batch_eval.evaluate(cells, players, mtaji, max_players)
+        self.assertEqual(scores.tolist(),
+                         [malume.eval_state(s, batch_eval.PLAYERS[m], 0)
+                          for s, m in zip(states, max_players)])
+
+
+if __name__ == '__main__':
+    unittest.main()
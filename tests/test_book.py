@@ -0,0 +1,46 @@
+import random
+import unittest
+
+import bao
+import book
+
+
+def random_positions(variant, n_games=20, max_plies=80, seed=0):
+    '''Yields the positions of random games of variant.'''
+    rng = random.Random(seed)
+    for _ in range(n_games):
+        state = bao.new_game(variant=variant).get_current_node()[1]
+        for _ in range(max_plies):
+            yield state
+            moves = [move for move, child in state.get_transitions()
+                     if child is not None]
+            if not moves:
+                break
+            state = state.get_child(rng.choice(moves))
+
+
+class MoveEncodingTest(unittest.TestCase):
+    def test_round_trip_legal_moves(self):
+        n_moves = n_takasa = 0
+        for variant in bao.get_variants():
+            for state in random_positions(variant):
+                for move in state.get_moves():
+                    code = book.encode_move(move)
+                    self.assertTrue(0 <= code < 256)
+                    self.assertEqual(book.decode_move(code), move)
+                    n_moves += 1
+                    n_takasa += move.endswith('$')
+        self.assertTrue(n_moves)
+        self.assertTrue(n_takasa, 'no takasa move in the sample')
+
+    def test_takasa(self):
+        for move in ('a5-$', 'A5-$'):
+            self.assertEqual(book.decode_move(book.encode_move(move)), move)
+
+    def test_invalid_direction(self):
+        self.assertRaises(ValueError, book.encode_move, 'a5L$')
+        self.assertRaises(ValueError, book.encode_move, 'a5-')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import random
+import tempfile
+import unittest
+
+import bao
+import gameRecord
+
+
+def play_game(variant, seed, max_plies=200):
+    '''Returns the History of a random game of variant, takasa moves ('$')
+    being played whenever there is one.'''
+    rng = random.Random(seed)
+    history = bao.new_game(variant=variant)
+    for _ in range(max_plies):
+        state = history.get_current_node()[1]
+        moves = [move for move, child in state.get_transitions()
+                 if child is not None]
+        if not moves:
+            break
+        takasa = [move for move in moves if move.endswith('$')]
+        history.branch(rng.choice(takasa or moves))
+    return history
+
+
+class GameRecordTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.games')
+        os.close(fd)
+        os.remove(self.path)
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_round_trip_takasa(self):
+        histories = []
+        for seed in range(10):
+            history = play_game('yabambo', seed)
+            moves = [history[i][0] for i in range(1, len(history))]
+            if any(move.endswith('$') for move in moves):
+                histories.append(history)
+        self.assertTrue(histories, 'no game with a takasa move')
+
+        with gameRecord.RecordWriter(self.path) as writer:
+            for history in histories:
+                writer.write(gameRecord.from_history(history, 'yabambo',
+                                                     'AB'))
+
+        records = list(gameRecord.read_records(self.path))
+        self.assertEqual(len(records), len(histories))
+        for record, history in zip(records, histories):
+            self.assertEqual(record.variant, 'yabambo')
+            self.assertEqual(record.winner, 'AB')
+            self.assertEqual(record.moves,
+                             [history[i][0].rstrip('*')
+                              for i in range(1, len(history))])
+            positions = [state.get_hash()
+                         for state, move in gameRecord.replay(record)]
+            self.assertEqual(positions,
+                             [history[i][1].get_hash()
+                              for i in range(len(history) - 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+
+import player
+import tournament
+
+
+class MakePlayerTest(unittest.TestCase):
+    def test_vars(self):
+        agent = tournament.make_player('malume:move_time=100,ponder=1')
+        self.assertEqual(agent.vars['move_time'], 100)
+        self.assertEqual(agent.vars['ponder'], 1)
+        self.assertEqual(agent.vars['verbose'], 0)
+
+    def test_tt_mb_resizes_table(self):
+        agent = tournament.make_player('malume:tt_mb=0')
+        self.assertEqual(agent.tt.size, 0)
+        agent = tournament.make_player('malume:tt_mb=1')
+        self.assertEqual(agent.tt.size,
+                         2**20 // player.TranspositionTable.ENTRY_SIZE)
+
+    def test_unknown_var(self):
+        self.assertRaises(tournament.TournamentError,
+                          tournament.make_player, 'montecarlo:tt_mb=1')
+
+
+if __name__ == '__main__':
+    unittest.main()
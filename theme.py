@@ -1,22 +1,393 @@
+#!/usr/bin/python
+'''Board themes.
+
+A theme is a JSON manifest, THEME_DIR_PATH/NAME.json, and a sprite sheet
+holding all of its images:
+
+    {
+        "format": 1,
+        "sheet": "NAME/sprites.png",
+        "images": {"board": [x, y, width, height], "seed": [...], ...},
+        "notification_area": {"x": 185, "y": 340},
+        "field_label": {"ab": {"x": ..., "y": ...}, "AB": {...}},
+        "board": {
+            "image": "board",
+            "seed": {"image": "seed"},
+            "holes": {"A1": {"x": ..., "y": ..., "select_image": "...",
+                             "deselect_image": "..."}, ...}
+        }
+    }
+
+(see SCHEMA, seed is optional), images being referred to by their names
+in images. get_theme returns it in the form BoardView.load_theme takes,
+with PhotoImages in place of image names. Loaded themes are kept in
+THEME_CACHE_DIR_PATH as a single file holding the checked manifest and
+the decoded sheet:
+
+    CACHE_MAGIC, header length (uint32), JSON header ({"version": ...,
+    "sources": {path: mtime_ns}, "manifest": {...}, "mode": "RGBA",
+    "size": [width, height]}), then the sheet's raw pixel data
+
+Older themes are Python scripts (NAME.py), they are not loaded anymore,
+running this module converts them:
+
+    python3 theme.py convert NAME
+
+Converting needs the script and the images it loads (with load_image,
+paths relative to THEME_DIR_PATH) to be in THEME_DIR_PATH, the sheet is
+written to THEME_DIR_PATH/NAME/sprites.png. The themes that come with
+PyBawo are kept as manifests and sheets only, edit those directly.
+'''
+import argparse
+import json
 import os
 import os.path
+import struct
+import sys
+
+import bao
 
 THEME_DIR_PATH = 'themes'
+THEME_CACHE_DIR_PATH = os.path.join(THEME_DIR_PATH, '__cache__')
+
+MANIFEST_FORMAT = 1
+CACHE_MAGIC = b'BAOTHEME'
+CACHE_VERSION = 2
+_CACHE_HEADER = struct.Struct('<I')
+
+# Schema of manifests: dicts give the schema of each key's value ('*' for
+# any other key, a trailing '?' for optional keys) and lists that of
+# every item.
+_POINT = {'x': int, 'y': int}
+_HOLE = {'x': int, 'y': int, 'select_image': str, 'deselect_image': str}
+SCHEMA = {
+    'format': int,
+    'sheet': str,
+    'images': {'*': [int]},
+    'notification_area': _POINT,
+    'field_label': {'ab': _POINT, 'AB': _POINT},
+    'board': {
+        'image': str,
+        'seed?': {'image': str},
+        'holes': {'*': _HOLE}
+    }
+}
+
+THEME_HOLES = frozenset(bao.HOLES + ('A9', 'B9', 'a9', 'b9'))
+
+# Decoded images by absolute path and themes by name, shared by every
+# window (PhotoImages belong to the default Tk root).
+_images = {}
+_themes = {}
+_theme_names = None
+
+
+class ThemeError(Exception):
+    pass
 
 
 def load_image(path):
-    import PIL.ImageTk as imageTk
+    '''Returns the PhotoImage of the image at path, decoding it only the
+    first time.'''
+    key = os.path.abspath(path)
+    image = _images.get(key)
+    if image is None:
+        import PIL.ImageTk as imageTk
 
-    image = imageTk.Image.open(path)
-    return imageTk.PhotoImage(image)
+        image = imageTk.PhotoImage(imageTk.Image.open(path))
+        _images[key] = image
+    return image
 
 def get_theme(theme_name='classic'):
-    image_loader = lambda p: load_image(os.path.join(THEME_DIR_PATH, p))
-    sym_tab =  {'load_image': image_loader, 'self': None}
-                
+    '''Returns theme_name's definition, loading it only the first time.
+    Themes are shared, don't modify them.'''
+    if theme_name in _themes:
+        return _themes[theme_name]
+
+    manifest_path = os.path.join(THEME_DIR_PATH, theme_name + '.json')
+    if not os.path.exists(manifest_path):
+        raise ThemeError('No theme {} in {}'.format(theme_name,
+                                                    THEME_DIR_PATH))
+
+    theme = _load_manifest_theme(theme_name, manifest_path)
+    _themes[theme_name] = theme
+    return theme
+
+def get_theme_names():
+    '''Returns the names of the themes in THEME_DIR_PATH.'''
+    global _theme_names
+    if _theme_names is None:
+        names = set()
+        for f in os.listdir(THEME_DIR_PATH):
+            name, ext = os.path.splitext(f)
+            if ext == '.json' and not f.startswith('.'):
+                names.add(name)
+        _theme_names = sorted(names)
+    return list(_theme_names)
+
+def clear_cache():
+    '''Forget loaded images and themes, eg after editing a theme.'''
+    global _theme_names
+    _images.clear()
+    _themes.clear()
+    _theme_names = None
+
+def validate(manifest, schema=SCHEMA, path='theme'):
+    '''Raises ThemeError if manifest does not follow schema.'''
+    if isinstance(schema, dict):
+        if not isinstance(manifest, dict):
+            raise ThemeError('{}: object expected'.format(path))
+        for key, value_schema in schema.items():
+            name = key.rstrip('?')
+            if name == '*':
+                continue
+            elif name in manifest:
+                validate(manifest[name], value_schema, path + '.' + name)
+            elif not key.endswith('?'):
+                raise ThemeError('{}: {} missing'.format(path, name))
+        for key, value in manifest.items():
+            if key in schema or key + '?' in schema:
+                continue
+            elif '*' in schema:
+                validate(value, schema['*'], path + '.' + key)
+            else:
+                raise ThemeError('{}: unknown key {}'.format(path, key))
+    elif isinstance(schema, list):
+        if not isinstance(manifest, list):
+            raise ThemeError('{}: list expected'.format(path))
+        for i, item in enumerate(manifest):
+            validate(item, schema[0], '{}[{}]'.format(path, i))
+    elif not isinstance(manifest, schema) or isinstance(manifest, bool):
+        raise ThemeError('{}: {} expected'.format(path, schema.__name__))
+
+def check_manifest(manifest):
+    '''Validates manifest and the references within it.'''
+    validate(manifest)
+    if manifest['format'] != MANIFEST_FORMAT:
+        raise ThemeError('Unsupported theme format {}'.format(
+            manifest['format']))
+    images = manifest['images']
+    for name, box in images.items():
+        if len(box) != 4:
+            raise ThemeError('theme.images.{}: [x, y, width, height] '
+                             'expected'.format(name))
+    board = manifest['board']
+    used = [('theme.board.image', board['image'])]
+    if 'seed' in board:
+        used.append(('theme.board.seed.image', board['seed']['image']))
+    for hole, hole_def in board['holes'].items():
+        if hole not in THEME_HOLES:
+            raise ThemeError('theme.board.holes: unknown hole ' + hole)
+        for key in ('select_image', 'deselect_image'):
+            used.append(('theme.board.holes.{}.{}'.format(hole, key),
+                         hole_def[key]))
+    for path, name in used:
+        if name not in images:
+            raise ThemeError('{}: unknown image {}'.format(path, name))
+
+# private:
+def _run_theme_script(theme_name, image_loader):
+    # Builds an old (Python) theme, images being loaded by image_loader.
+    # Only for convert, the script runs with the interpreter's rights.
+    sym_tab = {'load_image':
+                   lambda p: image_loader(os.path.join(THEME_DIR_PATH, p)),
+               'self': None}
+
     full_theme_path = os.path.join(THEME_DIR_PATH, theme_name + '.py')
-    theme_script = open(full_theme_path).read()
+    with open(full_theme_path) as theme_file:
+        theme_script = theme_file.read()
 
     exec(compile(theme_script, full_theme_path, 'exec'), sym_tab)
 
     return sym_tab['self']
+
+def _load_manifest_theme(theme_name, manifest_path):
+    import PIL.ImageTk as imageTk
+
+    manifest, sheet = _read_theme_cache(theme_name)
+    if manifest is None:
+        with open(manifest_path) as manifest_file:
+            try:
+                manifest = json.load(manifest_file)
+            except ValueError as e:
+                raise ThemeError('{}: {}'.format(manifest_path, e))
+        check_manifest(manifest)
+        sheet_path = os.path.join(THEME_DIR_PATH, manifest['sheet'])
+        sheet = imageTk.Image.open(sheet_path).convert('RGBA')
+        _write_theme_cache(theme_name, manifest, sheet,
+                           (manifest_path, sheet_path))
+
+    images = {}
+    for name, (x, y, width, height) in manifest['images'].items():
+        images[name] = imageTk.PhotoImage(
+            sheet.crop((x, y, x + width, y + height)))
+    return _build_theme(manifest, images)
+
+def _build_theme(manifest, images):
+    # The manifest with images in place of image names
+    board = manifest['board']
+    theme = {
+        'notification_area': dict(manifest['notification_area']),
+        'field_label': dict((field, dict(point)) for field, point
+                            in manifest['field_label'].items()),
+        'board': {
+            'image': images[board['image']],
+            'holes': {}
+        }
+    }
+    if 'seed' in board:
+        theme['board']['seed'] = {'image': images[board['seed']['image']]}
+    for hole, hole_def in board['holes'].items():
+        theme['board']['holes'][hole] = {
+            'x': hole_def['x'],
+            'y': hole_def['y'],
+            'select_image': images[hole_def['select_image']],
+            'deselect_image': images[hole_def['deselect_image']]
+        }
+    return theme
+
+def _get_cache_path(theme_name):
+    return os.path.join(THEME_CACHE_DIR_PATH, theme_name + '.cache')
+
+def _read_theme_cache(theme_name):
+    # Returns (manifest, sheet) from the theme's cache, (None, None) if
+    # there is no cache or its sources have changed since.
+    import PIL.Image as image
+
+    try:
+        with open(_get_cache_path(theme_name), 'rb') as cache_file:
+            data = cache_file.read()
+        offset = len(CACHE_MAGIC)
+        if data[:offset] != CACHE_MAGIC:
+            return None, None
+        header_size, = _CACHE_HEADER.unpack_from(data, offset)
+        offset += _CACHE_HEADER.size
+        header = json.loads(
+            data[offset:offset + header_size].decode('utf-8'))
+        if header['version'] != CACHE_VERSION:
+            return None, None
+        for path, mtime in header['sources'].items():
+            if os.stat(path).st_mtime_ns != mtime:
+                return None, None
+        manifest = header['manifest']
+        check_manifest(manifest)
+        sheet = image.frombytes(header['mode'], tuple(header['size']),
+                                data[offset + header_size:])
+        return manifest, sheet
+    except (OSError, KeyError, ValueError, TypeError, struct.error,
+            ThemeError):
+        return None, None
+
+def _write_theme_cache(theme_name, manifest, sheet, sources):
+    header = json.dumps({
+        'version': CACHE_VERSION,
+        'sources': dict((path, os.stat(path).st_mtime_ns)
+                        for path in sources),
+        'manifest': manifest,
+        'mode': sheet.mode,
+        'size': list(sheet.size)
+    }).encode('utf-8')
+    try:
+        os.makedirs(THEME_CACHE_DIR_PATH, exist_ok=True)
+        with open(_get_cache_path(theme_name), 'wb') as cache_file:
+            cache_file.write(CACHE_MAGIC + _CACHE_HEADER.pack(len(header))
+                             + header)
+            cache_file.write(sheet.tobytes())
+    except OSError:
+        pass    # eg a read only installation, the theme loads without
+
+class _ImageSource(object):
+    # Stands in for the images of a theme script being converted
+    def __init__(self, path):
+        import PIL.Image as image
+
+        self.path = path
+        self.image = image.open(path).convert('RGBA')
+
+    def width(self):
+        return self.image.width
+
+    def height(self):
+        return self.image.height
+
+def convert(theme_name):
+    '''Converts the theme script THEME_DIR_PATH/theme_name.py to a
+    manifest and sprite sheet, returns the path of the manifest.
+
+    The images the script loads must be in THEME_DIR_PATH, images are
+    named after their files in the manifest.
+    '''
+    import PIL.Image as image
+
+    sources = {}
+    def load_source(path):
+        if path not in sources:
+            sources[path] = _ImageSource(path)
+        return sources[path]
+    theme = _run_theme_script(theme_name, load_source)
+
+    # Images are named after their files and stacked up in the sheet
+    names = {}
+    boxes = {}
+    y = 0
+    for path, source in sorted(sources.items()):
+        name = os.path.splitext(os.path.basename(path))[0]
+        names[source] = name
+        boxes[name] = [0, y, source.width(), source.height()]
+        y += source.height()
+    sheet = image.new('RGBA', (max(s.width() for s in sources.values()), y))
+    for source in sources.values():
+        x, y = boxes[names[source]][:2]
+        sheet.paste(source.image, (x, y))
+
+    board = theme['board']
+    manifest = {
+        'format': MANIFEST_FORMAT,
+        'sheet': theme_name + '/sprites.png',
+        'images': boxes,
+        'notification_area': theme['notification_area'],
+        'field_label': theme['field_label'],
+        'board': {
+            'image': names[board['image']],
+            'holes': {}
+        }
+    }
+    if 'seed' in board:
+        manifest['board']['seed'] = {'image': names[board['seed']['image']]}
+    for hole, hole_def in sorted(board['holes'].items()):
+        manifest['board']['holes'][hole] = {
+            'x': hole_def['x'],
+            'y': hole_def['y'],
+            'select_image': names[hole_def['select_image']],
+            'deselect_image': names[hole_def['deselect_image']]
+        }
+    check_manifest(manifest)
+
+    sheet.save(os.path.join(THEME_DIR_PATH, manifest['sheet']))
+    manifest_path = os.path.join(THEME_DIR_PATH, theme_name + '.json')
+    with open(manifest_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=4, sort_keys=True)
+        manifest_file.write('\n')
+    return manifest_path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('command', choices=('convert', 'check'),
+                        help='convert theme scripts or check manifests')
+    parser.add_argument('themes', nargs='+', metavar='NAME')
+
+    args = parser.parse_args(sys.argv[1:])
+    for theme_name in args.themes:
+        try:
+            if args.command == 'convert':
+                print('Wrote ' + convert(theme_name))
+            else:
+                path = os.path.join(THEME_DIR_PATH, theme_name + '.json')
+                with open(path) as manifest_file:
+                    check_manifest(json.load(manifest_file))
+                print(theme_name + ' OK')
+        except (ThemeError, OSError, ValueError) as e:
+            parser.exit(1, 'Error: {}: {}\n'.format(theme_name, e))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+#!/usr/bin/python
+'''Self-play tournaments between computer players, without the GUI.
+
+Players are given as ENGINE[:var=value,...], eg malume:move_time=500 or
+montecarlo:playouts=2000 (see the vars of player.Malume and
+player.MonteCarlo). Every pair of players plays --games games, switching
+fields after every game. Games run in parallel worker processes, each
+game is run by an arbiter.Arbiter as in GameWindow.
+
+Reports each player's results and Elo rating (relative to the first
+player), the average game length, time per move and search speed.
+'''
+import argparse
+import concurrent.futures
+import itertools
+import math
+import os
+import random
+import sys
+import time
+
+import arbiter
+import bao
+import baoAgent
+import gameRecord
+import player
+
+
+class TournamentError(Exception):
+    pass
+
+
+def parse_player(spec):
+    '''Returns (engine name, vars) for a player spec.'''
+    engine, _, settings = spec.partition(':')
+    if engine not in player.ENGINES:
+        raise TournamentError('Unknown engine {}'.format(engine))
+    variables = {}
+    for setting in filter(None, settings.split(',')):
+        name, _, value = setting.partition('=')
+        try:
+            variables[name.strip()] = int(value)
+        except ValueError:
+            raise TournamentError('Invalid setting {}'.format(setting))
+    return engine, variables
+
+
+def make_player(spec):
+    engine, variables = parse_player(spec)
+    agent = player.ENGINES[engine]()
+    unknown = set(variables) - set(agent.vars)
+    if unknown:
+        raise TournamentError('Unknown {} vars: {}'.format(
+            engine, ', '.join(sorted(unknown))))
+    if 'ponder' in agent.vars:
+        # Both players share a process, pondering would slow the opponent down
+        agent.set_var('ponder', 0)
+    for name, value in variables.items():
+        agent.set_var(name, value)
+    agent.set_var('verbose', 0)
+    return agent
+
+
+def _get_search_count(agent):
+    # Work done for the last move: nodes searched or playouts played
+    if isinstance(agent, player.MonteCarlo):
+        return agent.playouts
+    return agent.nodes_pondered
+
+
+class Match(object):
+    '''Plays a single game between two players.'''
+    def __init__(self, variant, AB_spec, ab_spec, max_plies=500,
+                 move_timeout=600):
+        self.variant = variant
+        self.specs = {'AB': AB_spec, 'ab': ab_spec}
+        self.max_plies = max_plies
+        self.move_timeout = move_timeout
+
+    def play(self):
+        '''Returns a dict describing the game's outcome.'''
+        game_arbiter = arbiter.Arbiter(variant=self.variant)
+        players = {}
+        for field in ('AB', 'ab'):
+            players[field] = make_player(self.specs[field])
+            players[field].new_game(field, variant=self.variant)
+
+        stats = dict((field, {'moves': 0, 'time': 0.0, 'searched': 0})
+                     for field in ('AB', 'ab'))
+        result = {'winner': None, 'plies': 0, 'reason': None, 'stats': stats}
+        turn_start = time.time()
+
+        def on_move_started(field, move):
+            stats[field]['moves'] += 1
+            stats[field]['time'] += time.time() - turn_start
+            stats[field]['searched'] += _get_search_count(players[field])
+
+        def on_move_done(field, move):
+            nonlocal turn_start
+            result['plies'] += 1
+            turn_start = time.time()
+
+        def on_move_rejected(field, move, reason):
+            raise TournamentError('{} made an illegal move {} ({})'.format(
+                self.specs[field], move, reason))
+
+        def on_ack(field, request, status, reason):
+            if status == baoAgent.STS_REJECT:
+                raise TournamentError('{} rejected a request: {}'.format(
+                    self.specs[field], reason))
+
+        def on_game_over(winner, reason):
+            result['winner'] = winner
+            result['reason'] = reason
+
+        for event, listener in (('move_started', on_move_started),
+                                ('move_done', on_move_done),
+                                ('move_rejected', on_move_rejected),
+                                ('ack', on_ack),
+                                ('game_over', on_game_over)):
+            game_arbiter.subscribe(event, listener)
+
+        try:
+            game_arbiter.new_game(players['AB'], players['ab'])
+            while not game_arbiter.game_over:
+                if result['plies'] >= self.max_plies:
+                    result['reason'] = 'move limit'
+                    break
+                if not game_arbiter.process(timeout=self.move_timeout):
+                    raise TournamentError('{} did not move'.format(
+                        self.specs[game_arbiter.game.get_player()]))
+        finally:
+            for agent in players.values():
+                agent.stop_ponder()
+                if hasattr(agent, 'stop_workers'):
+                    agent.stop_workers()
+        result['record'] = gameRecord.from_history(game_arbiter.game,
+                                                   self.variant,
+                                                   result['winner'])
+        return result
+
+
+def _play_game(args):
+    variant, AB_spec, ab_spec, max_plies, seed = args
+    random.seed(seed)
+    return Match(variant, AB_spec, ab_spec, max_plies).play()
+
+
+def estimate_elo(points, games, iterations=200):
+    '''Returns Elo ratings relative to the first player from pairwise
+    results, points[i][j] being what player i scored in games[i][j] games
+    against player j.
+
+    Uses the Bradley-Terry model with a draw added to every pairing so that
+    perfect scores still get finite ratings.
+    '''
+    n = len(points)
+    strength = [1.0] * n
+    for _ in range(iterations):
+        for i in range(n):
+            won = sum(points[i][j] + 0.5 for j in range(n)
+                      if j != i and games[i][j])
+            weight = sum((games[i][j] + 1) / (strength[i] + strength[j])
+                         for j in range(n) if j != i and games[i][j])
+            if weight:
+                strength[i] = won / weight
+    return [400 * math.log10(s / strength[0]) for s in strength]
+
+
+def run(specs, variant, games, jobs=None, max_plies=500, seed=None,
+        out=sys.stdout, record_path=None):
+    '''Play a round robin between specs, games per pairing, and write a
+    report to out. Returns the list of game results.
+
+    Games are appended to the game record file at record_path if given.
+    '''
+    for spec in specs:
+        parse_player(spec)  # fail early on bad specs
+    rng = random.Random(seed)
+    schedule = []
+    for i, j in itertools.combinations(range(len(specs)), 2):
+        for game in range(games):
+            AB, ab = (i, j) if game % 2 == 0 else (j, i)
+            schedule.append((AB, ab, (variant, specs[AB], specs[ab],
+                                      max_plies, rng.getrandbits(32))))
+
+    n = len(specs)
+    points = [[0.0] * n for _ in range(n)]
+    played = [[0] * n for _ in range(n)]
+    totals = [{'wins': 0, 'draws': 0, 'losses': 0, 'moves': 0, 'time': 0.0,
+               'searched': 0} for _ in range(n)]
+    results = []
+    start_time = time.time()
+    writer = gameRecord.RecordWriter(record_path) if record_path else None
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = dict((pool.submit(_play_game, args), (AB, ab))
+                       for AB, ab, args in schedule)
+        for future in concurrent.futures.as_completed(futures):
+            AB, ab = futures[future]
+            result = future.result()
+            results.append(result)
+            if writer:
+                writer.write(result['record'])
+            for index, field in ((AB, 'AB'), (ab, 'ab')):
+                other = ab if index == AB else AB
+                played[index][other] += 1
+                if result['winner'] is None:
+                    points[index][other] += 0.5
+                    totals[index]['draws'] += 1
+                elif result['winner'] == field:
+                    points[index][other] += 1
+                    totals[index]['wins'] += 1
+                else:
+                    totals[index]['losses'] += 1
+                for key in ('moves', 'time', 'searched'):
+                    totals[index][key] += result['stats'][field][key]
+            out.write('Game {}/{}: {} (AB) vs {} (ab): {} after {} plies '
+                      '({})\n'.format(len(results), len(schedule), specs[AB],
+                                      specs[ab], result['winner'] or 'draw',
+                                      result['plies'], result['reason']))
+    elapsed = time.time() - start_time
+    if writer:
+        writer.close()
+
+    ratings = estimate_elo(points, played)
+    out.write('\n{:<40} {:>6} {:>5} {:>5} {:>6} {:>6} {:>6} {:>9} {:>11}\n'
+              .format('Player', 'Games', 'Wins', 'Draws', 'Losses', 'Score',
+                      'Elo', 's/move', 'searched/s'))
+    for i, spec in enumerate(specs):
+        total = totals[i]
+        n_games = total['wins'] + total['draws'] + total['losses']
+        out.write('{:<40} {:>6} {:>5} {:>5} {:>6} {:>6.0%} {:>+6.0f} '
+                  '{:>9.3f} {:>11.0f}\n'.format(
+                      spec, n_games, total['wins'], total['draws'],
+                      total['losses'],
+                      (total['wins'] + 0.5 * total['draws']) / max(n_games, 1),
+                      ratings[i], total['time'] / max(total['moves'], 1),
+                      total['searched'] / max(total['time'], 1e-6)))
+    out.write('\n{} games in {:.0f} seconds, {:.1f} plies per game\n'.format(
+        len(results), elapsed,
+        sum(r['plies'] for r in results) / max(len(results), 1)))
+    out.write('searched/s counts nodes for malume and playouts for '
+              'montecarlo\n')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('players', nargs='+', metavar='PLAYER',
+                        help='ENGINE[:var=value,...] with ENGINE one of '
+                             + ', '.join(sorted(player.ENGINES)))
+    parser.add_argument('--variant', default='ntchuwa',
+                        choices=bao.get_variants())
+    parser.add_argument('--games', type=int, default=10,
+                        help='games per pair of players')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help='games played at the same time')
+    parser.add_argument('--max-plies', type=int, default=500,
+                        help='games longer than this are drawn')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--record', metavar='PATH',
+                        help='append the games to a game record file')
+
+    args = parser.parse_args(sys.argv[1:])
+    if len(args.players) < 2:
+        parser.error('at least two players are needed')
+    try:
+        run(args.players, args.variant, args.games, args.jobs,
+            args.max_plies, args.seed, record_path=args.record)
+    except TournamentError as e:
+        parser.exit(1, 'Error: {}\n'.format(e))
+
+if __name__ == '__main__':
+    main()